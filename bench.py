@@ -0,0 +1,267 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from bitboard import BitBoard
+from game_state import FILL_ALGOS, FieldCountAlgo, GameState
+from util import Deadline, Direction
+
+###
+# Benchmarks for the decision engine on synthetic boards.
+# Boards are filled with random-walk trails so regions, heads and bottlenecks look like a
+# running game. Everything runs headless (GameState's default renderer draws nothing).
+#
+#   python bench.py --sizes 32 128 --players 2 20 --save baseline.json
+#   python bench.py --sizes 32 128 --players 2 20 --compare baseline.json
+#   python bench.py --check-fill
+
+
+class SyntheticGame:
+    def __init__(self, size: int, players: int, fill: float, seed: int, fill_algo: str = "regions"):
+        self.rng = random.Random(seed)
+        self.size = size
+        self.state = GameState(size, size, 0, fill_algo=fill_algo)
+        self.heads = {}
+        self.dirs = {}
+        for pid in range(1, players):
+            self._spawn(pid)
+        # grow the opponents' trails until the requested share of the board is taken; a walker
+        # that boxed itself in starts over on a random free cell, or small boards with few
+        # players would stop far below the fill
+        target = int(size * size * fill)
+        taken = len(self.heads)
+        while taken < target and self.heads:
+            for pid in list(self.heads):
+                if not self._advance(pid):
+                    self._spawn(pid)
+                taken += 1
+        # our head goes into the largest free region, so the timings are of a player that can move
+        self._place_own()
+        board = self.state._board
+        own = board.index(*self.heads[0])
+        assert any(board.is_free(n) for n in board.adjacency[own]), "own head has no free move"
+
+    def _spawn(self, pid: int):
+        board = self.state._board
+        while True:
+            x = self.rng.randrange(self.size)
+            y = self.rng.randrange(self.size)
+            if board.is_free(board.index(x, y)):
+                break
+        self.heads[pid] = (x, y)
+        self.dirs[pid] = self.rng.choice(list(Direction))
+        self.state.update_player_pos(pid, x, y)
+
+    def _place_own(self):
+        board = self.state._board
+        seen = bytearray(self.size * self.size)
+        largest = []
+        for root in range(self.size * self.size):
+            if seen[root] or not board.is_free(root):
+                continue
+            seen[root] = 1
+            region = [root]
+            for idx in region:
+                for n in board.adjacency[idx]:
+                    if not seen[n] and board.is_free(n):
+                        seen[n] = 1
+                        region.append(n)
+            if len(region) > len(largest):
+                largest = region
+        starts = [idx for idx in largest if any(board.is_free(n) for n in board.adjacency[idx])]
+        x, y = board.coords(self.rng.choice(starts or largest))
+        self.heads[0] = (x, y)
+        self.dirs[0] = self.rng.choice(list(Direction))
+        self.state.update_player_pos(0, x, y)
+
+    def _advance(self, pid: int) -> bool:
+        # one step for one player, preferring its current direction
+        x, y = self.heads[pid]
+        options = [self.dirs[pid]] * 4 + list(Direction)
+        self.rng.shuffle(options)
+        for direc in options:
+            nx = direc.get_x(x, self.size)
+            ny = direc.get_y(y, self.size)
+            if self.state._board.is_free(self.state._board.index(nx, ny)):
+                self.dirs[pid] = direc
+                self.heads[pid] = (nx, ny)
+                self.state.update_player_pos(pid, nx, ny)
+                return True
+        return False
+
+    def step(self):
+        # advances every opponent that can still move by one cell, like one server tick
+        for pid in list(self.heads):
+            if pid != 0:
+                self._advance(pid)
+
+    def move_own(self, direc: Direction):
+        x, y = self.heads[0]
+        nx = direc.get_x(x, self.size)
+        ny = direc.get_y(y, self.size)
+        if self.state._board.is_free(self.state._board.index(nx, ny)):
+            self.heads[0] = (nx, ny)
+            self.state.update_player_pos(0, nx, ny)
+
+
+def _percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _summary(samples: list[float]) -> dict:
+    return {
+        "p50_ms": statistics.median(samples) * 1000,
+        "p99_ms": _percentile(samples, 0.99) * 1000,
+        "max_ms": max(samples) * 1000,
+        "n": len(samples),
+    }
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def bench_case(size: int, players: int, ticks: int, fill: float, seed: int, budget: float, fill_algo: str) -> dict:
+    game = SyntheticGame(size, players, fill, seed, fill_algo)
+    state = game.state
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        x, y = game.heads[0]
+        starts = [(d.get_x(x, size), d.get_y(y, size)) for d in Direction]
+        results["flood_fill_count"] = _summary([
+            _timed(FieldCountAlgo.flood_fill_count, state._board, sx, sy, size, size, state._last_positions)
+            for sx, sy in starts for _ in range(3)
+        ])
+        bits = BitBoard.from_board(state._board)
+        heads = state._flood_fill.head_set(state._last_positions)
+        results["bitboard_count"] = _summary([
+            _timed(bits.count, state._board.index(sx, sy), heads) for sx, sy in starts for _ in range(3)
+        ])
+        results["should_do_floodfill"] = _summary([_timed(state.should_do_floodfill) for _ in range(200)])
+
+        tick_samples = []
+        move_samples = []
+        for tick in range(ticks):
+            start = time.perf_counter()
+            game.step()
+            decide = time.perf_counter()
+            direc, _ = state.get_move(tick, Deadline(start, budget))
+            end = time.perf_counter()
+            tick_samples.append(end - start)
+            move_samples.append(end - decide)
+            game.move_own(direc)
+        results["get_move"] = _summary(move_samples)
+        results["tick"] = _summary(tick_samples)
+        cache = state.fill_cache_stats()
+        if cache is not None:
+            results["tick"]["fill_cache"] = cache
+
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        game.step()
+        state.get_move(ticks, Deadline(time.perf_counter(), budget))
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results["tick"]["alloc_kib"] = sum(s.size_diff for s in after.compare_to(before, "filename")) / 1024
+        results["tick"]["peak_kib"] = peak / 1024
+
+        victims = [pid for pid in game.heads if pid != 0]
+        results["remove_player"] = _summary([_timed(state.remove_player, pid) for pid in victims] or [0.0])
+    return results
+
+
+def check_fill(sizes: list[int], players: list[int], fill: float, seed: int) -> bool:
+    # every fill algorithm has to report the same (num_fields, player_count) for every free cell
+    ok = True
+    for size in sizes:
+        for count in players:
+            if count * 4 > size * size:
+                continue
+            game = SyntheticGame(size, count, fill, seed)
+            state = game.state
+            board = state._board
+            bits = BitBoard.from_board(board)
+            heads = state._flood_fill.head_set(state._last_positions)
+            mismatches = 0
+            for idx in range(0, size * size, max(1, size * size // 500)):
+                if not board.is_free(idx):
+                    continue
+                x, y = board.coords(idx)
+                expected = FieldCountAlgo.flood_fill_count(board, x, y, size, size, state._last_positions)
+                got = [state._regions.query(board, idx, state._last_positions), bits.count(idx, heads)]
+                if any(result != expected for result in got):
+                    mismatches += 1
+            print("%ix%i/%i: %s" % (size, size, count, "ok" if mismatches == 0 else "%i mismatches" % mismatches))
+            ok = ok and mismatches == 0
+    return ok
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> bool:
+    regressed = False
+    for case, functions in current.items():
+        for name, stats in functions.items():
+            old = baseline.get(case, {}).get(name)
+            if old is None or old["p50_ms"] == 0:
+                continue
+            ratio = stats["p50_ms"] / old["p50_ms"]
+            marker = ""
+            if ratio > 1 + threshold:
+                marker = "  REGRESSION"
+                regressed = True
+            print("%-14s %-20s p50 %8.3fms -> %8.3fms (%5.2fx)%s" % (case, name, old["p50_ms"], stats["p50_ms"], ratio, marker))
+    return regressed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the decision engine on synthetic boards')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 64, 128, 256, 512])
+    parser.add_argument('--players', type=int, nargs='+', default=[2, 10, 50, 100])
+    parser.add_argument('--ticks', type=int, default=50)
+    parser.add_argument('--fill', type=float, default=0.3, help='share of the board covered by trails')
+    parser.add_argument('--budget', type=float, default=0, help='tick budget in ms passed to get_move (0 = unbounded)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--fill-algo', choices=FILL_ALGOS, default='regions', help='fill algorithm used by get_move')
+    parser.add_argument('--check-fill', action='store_true', help='only check that all fill algorithms agree')
+    parser.add_argument('--save', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='compare against results saved with --save')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p50 slowdown before flagging a regression')
+    args = parser.parse_args()
+
+    if args.check_fill:
+        sys.exit(0 if check_fill(args.sizes, args.players, args.fill, args.seed) else 1)
+    budget = args.budget / 1000 if args.budget > 0 else None
+    results = {}
+    for size in args.sizes:
+        for players in args.players:
+            if players * 4 > size * size:
+                continue
+            case = "%ix%i/%i" % (size, size, players)
+            results[case] = bench_case(size, players, args.ticks, args.fill, args.seed, budget, args.fill_algo)
+            tick = results[case]["tick"]
+            print("%-14s tick p50 %8.3fms p99 %8.3fms  alloc %8.1fKiB  peak %8.1fKiB" % (
+                case, tick["p50_ms"], tick["p99_ms"], tick["alloc_kib"], tick["peak_kib"]))
+            if "fill_cache" in tick:
+                cache = tick["fill_cache"]
+                print("    fill cache: %i hits, %i misses, %i invalidated, %i evicted, ~%.1fms saved" % (
+                    cache["hits"], cache["misses"], cache["invalidations"], cache["evictions"], cache["saved_ms"]))
+            for name in ["get_move", "flood_fill_count", "bitboard_count", "should_do_floodfill", "remove_player"]:
+                stats = results[case][name]
+                print("    %-20s p50 %8.3fms p99 %8.3fms" % (name, stats["p50_ms"], stats["p99_ms"]))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
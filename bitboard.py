@@ -0,0 +1,104 @@
+from functools import lru_cache
+from typing import Hashable, Iterable, Optional
+
+from board import Board
+from util import Deadline
+
+
+@lru_cache(maxsize=8)
+def _masks(width: int, height: int) -> tuple[int, int, int, int]:
+    # bit idx = x * height + y, the same as Board indices
+    first_in_col = 0
+    for x in range(width):
+        first_in_col |= 1 << (x * height)
+    last_in_col = first_in_col << (height - 1)
+    full = (1 << (width * height)) - 1
+    first_col = (1 << height) - 1
+    return full, first_in_col, last_in_col, first_col
+
+
+class BitBoard:
+    ###
+    # Occupancy of the whole board as one big integer, one bit per cell (set = taken).
+    # A region is grown by dilating its bit set into all four directions at once with
+    # shifts, masking the bits that wrap around the torus, and keeping only free cells.
+    # Every dilation step touches the whole region with a handful of big-int operations
+    # instead of one Python step per cell.
+    def __init__(self, width: int, height: int):
+        self._width = width
+        self._height = height
+        self._full, self._first_in_col, self._last_in_col, self._first_col = _masks(width, height)
+        self.occupied = 0
+
+    @classmethod
+    def from_board(cls, board: Board) -> "BitBoard":
+        bits = cls(board.width, board.height)
+        for idx, owner in enumerate(board.cells):
+            if owner:
+                bits.occupied |= 1 << idx
+        return bits
+
+    def block(self, idx: int):
+        self.occupied |= 1 << idx
+
+    def free(self, idx: int):
+        self.occupied &= ~(1 << idx)
+
+    def dilate(self, bits: int) -> int:
+        height = self._height
+        wrap = height * (self._width - 1)
+        last_in_col = self._last_in_col
+        first_in_col = self._first_in_col
+        up = ((bits >> 1) & ~last_in_col) | ((bits & first_in_col) << (height - 1))
+        down = ((bits << 1) & ~first_in_col & self._full) | ((bits & last_in_col) >> (height - 1))
+        left = (bits >> height) | ((bits & self._first_col) << wrap)
+        right = ((bits << height) & self._full) | (bits >> wrap)
+        return bits | up | down | left | right
+
+    def reachable(self, idx: int) -> int:
+        free = self._full & ~self.occupied
+        region = (1 << idx) & free
+        if not region:
+            return 0
+        while True:
+            grown = self.dilate(region) & free
+            if grown == region:
+                return region
+            region = grown
+
+    def count(self, idx: int, heads: set[int]) -> tuple[int, int]:
+        return self._count(self.reachable(idx), self._head_bits(heads))
+
+    def count_many(self, starts: Iterable[tuple[Hashable, int]], heads: set[int],
+                   deadline: Optional[Deadline] = None) -> dict[Hashable, tuple[int, int]]:
+        # same contract as FloodFill.count_many, starts in an already grown region reuse its result
+        head_bits = self._head_bits(heads)
+        regions = []
+        results = {}
+        for key, idx in starts:
+            if deadline is not None and deadline.expired():
+                break  # starts not reached are left out
+            bit = 1 << idx
+            for region, result in regions:
+                if region & bit:
+                    results[key] = result
+                    break
+            else:
+                region = self.reachable(idx)
+                results[key] = self._count(region, head_bits)
+                if region:
+                    regions.append((region, results[key]))
+        return results
+
+    def _count(self, region: int, head_bits: int) -> tuple[int, int]:
+        if not region:
+            return 0, 0
+        border = self.dilate(region) & ~region
+        return region.bit_count(), (border & head_bits).bit_count()
+
+    @staticmethod
+    def _head_bits(heads: set[int]) -> int:
+        bits = 0
+        for idx in heads:
+            bits |= 1 << idx
+        return bits
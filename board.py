@@ -0,0 +1,76 @@
+from array import array
+from functools import lru_cache
+from typing import Optional
+
+from util import Direction, Path
+
+FREE = 0
+
+
+class Topology:
+    ###
+    # Wrap-around neighbour tables for one board size, built once and shared by every board
+    # of that size. Cells are indexed as x * height + y.
+    #   steps[direction][idx]  index of the cell one step in that direction
+    #   adjacency[idx]         the four neighbour indices, in Direction order
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        size = width * height
+        steps = {d: array('I', bytes(4 * size)) for d in Direction}
+        for x in range(width):
+            col = x * height
+            left = ((x - 1) % width) * height
+            right = ((x + 1) % width) * height
+            for y in range(height):
+                idx = col + y
+                steps[Direction.UP][idx] = col + (y - 1) % height
+                steps[Direction.DOWN][idx] = col + (y + 1) % height
+                steps[Direction.LEFT][idx] = left + y
+                steps[Direction.RIGHT][idx] = right + y
+        self.steps = steps
+        self.adjacency = list(zip(*(steps[d] for d in Direction)))
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def of(width: int, height: int) -> "Topology":
+        return Topology(width, height)
+
+
+class Board:
+    ###
+    # The game field as one flat array of owners: FREE, or player id + 1.
+    def __init__(self, width: int, height: int, cells: Optional[array] = None):
+        topology = Topology.of(width, height)
+        self.width = width
+        self.height = height
+        self.steps = topology.steps
+        self.adjacency = topology.adjacency
+        self.cells = cells if cells is not None else array('H', bytes(2 * width * height))
+
+    def index(self, x: int, y: int) -> int:
+        return x * self.height + y
+
+    def coords(self, idx: int) -> tuple[int, int]:
+        return divmod(idx, self.height)
+
+    def owner(self, idx: int) -> Optional[int]:
+        value = self.cells[idx]
+        return None if value == FREE else value - 1
+
+    def is_free(self, idx: int) -> bool:
+        return self.cells[idx] == FREE
+
+    def claim(self, idx: int, playerid: int):
+        self.cells[idx] = playerid + 1
+
+    def release(self, idx: int):
+        self.cells[idx] = FREE
+
+    def step(self, idx: int, direction: Direction) -> int:
+        return self.steps[direction][idx]
+
+    def resolve(self, idx: int, path: Path) -> int:
+        dx, dy = path.offset()
+        x, y = divmod(idx, self.height)
+        return ((x + dx) % self.width) * self.height + (y + dy) % self.height
@@ -0,0 +1,188 @@
+from array import array
+from typing import Iterable, NamedTuple, Optional
+
+from board import Board
+from regions import may_split
+from util import Deadline
+
+
+class ChamberInfo(NamedTuple):
+    component: int  # free cells in the window connected to the target, the target included
+    chambers: list[int]  # sizes of the pieces the rest falls into once the target is taken, the board size if open
+
+    @property
+    def cuts(self) -> bool:
+        return len(self.chambers) > 1
+
+    @property
+    def usable(self) -> int:
+        # a player entering the target can only go on into one of the chambers
+        return 1 + max(self.chambers, default=0)
+
+
+CHAMBER_RADIUS = 16  # the analysis only looks at cells at most this many steps (per axis) from the head
+
+
+class ChamberAnalysis:
+    ###
+    # Articulation points of the free-cell graph (Tarjan's low-link DFS, iterative).
+    # Taking a cell that is an articulation point cuts its region into separate chambers;
+    # the DFS subtree sizes give the size of every chamber.
+    #   - only the window of CHAMBER_RADIUS around the head is searched, all free cells outside
+    #     it count as one node; a chamber that reaches it has open size (the board size), so
+    #     cuts are the pockets a move would seal off inside the window, and a tick's analysis
+    #     costs the same on every board size
+    #   - the local ring test (regions.may_split) rules out most cells without a search
+    #   - results are cached until the head moves or a cell in (or next to) the window changes
+    #   - with a deadline, the analysis stops when it passes and reports that it did not finish
+    def __init__(self, width: int, height: int, radius: int = CHAMBER_RADIUS):
+        size = width * height
+        # one more slot for the node standing for everything outside the window
+        self._disc = array('L', bytes(array('L').itemsize * (size + 1)))
+        self._low = array('L', bytes(array('L').itemsize * (size + 1)))
+        self._sub = array('L', bytes(array('L').itemsize * (size + 1)))
+        self._window = array('L', bytes(array('L').itemsize * size))
+        self._width = width
+        self._height = height
+        self._radius = radius
+        self._clock = 0
+        self._stamp = 0
+        self._center = -1
+        self._edge = []
+        self._cache = {}
+
+    def touch(self, board: Board, idx: int):
+        # call after cell idx was taken or freed
+        if not self._cache:
+            return
+        window = self._window
+        stamp = self._stamp
+        if window[idx] == stamp or any(window[n] == stamp for n in board.adjacency[idx]):
+            self._cache.clear()
+
+    def analyze(self, board: Board, center: int, targets: Iterable[int],
+                deadline: Optional[Deadline] = None) -> Optional[dict[int, ChamberInfo]]:
+        # targets (next to center) the ring test proves to be no cut are left out of the result;
+        # None if the deadline passed first
+        if center != self._center:
+            self._cache.clear()
+            self._mark_window(board, center)
+        targets = [t for t in targets if board.is_free(t)]
+        results = {}
+        for target in targets:
+            if target in self._cache:
+                results[target] = self._cache[target]
+                continue
+            if not may_split(board, target):
+                continue
+            if not self._search(board, target, targets, deadline):
+                return None
+            results[target] = self._cache[target]
+        return results
+
+    def _mark_window(self, board: Board, center: int):
+        self._center = center
+        self._stamp += 1
+        stamp = self._stamp
+        window = self._window
+        width = self._width
+        height = self._height
+        span = 2 * self._radius + 1
+        cx, cy = board.coords(center)
+        xs = [(cx + d) % width for d in range(-self._radius, self._radius + 1)] if width > span else range(width)
+        ys = [(cy + d) % height for d in range(-self._radius, self._radius + 1)] if height > span else range(height)
+        for x in xs:
+            col = x * height
+            for y in ys:
+                window[col + y] = stamp
+        # only cells on the window's border can have neighbours outside it
+        edge = []
+        if width > span:
+            edge.extend(xs[0] * height + y for y in ys)
+            edge.extend(xs[-1] * height + y for y in ys)
+        if height > span:
+            edge.extend(x * height + ys[0] for x in xs)
+            edge.extend(x * height + ys[-1] for x in xs)
+        self._edge = edge
+
+    def _search(self, board: Board, root: int, targets: list[int], deadline: Optional[Deadline] = None) -> bool:
+        # False if the deadline passed before the search finished, nothing is cached then
+        cells = board.cells
+        adjacency = board.adjacency
+        disc = self._disc
+        low = self._low
+        sub = self._sub
+        window = self._window
+        stamp = self._stamp
+        outside = len(cells)
+        if self._clock + len(cells) + 2 >= 2 ** (8 * disc.itemsize) - 1:
+            for buf in (disc, low, sub):
+                for i in range(len(buf)):
+                    buf[i] = 0
+            self._clock = 0
+        start = self._clock + 1
+        clock = start
+        wanted = set(targets)
+        pieces = {t: [] for t in wanted}
+        border = None  # the outside node's neighbours, found when the search first gets there
+        disc[root] = low[root] = clock
+        sub[root] = 1
+        stack = [(root, -1, 0)]
+        steps = 0
+        while stack:
+            steps += 1
+            if deadline is not None and not steps & 255 and deadline.expired():
+                self._clock = clock
+                return False
+            v, parent, i = stack[-1]
+            if i < (4 if v != outside else len(border)):
+                stack[-1] = (v, parent, i + 1)
+                if v == outside:
+                    w = border[i]
+                else:
+                    w = adjacency[v][i]
+                    if cells[w]:
+                        continue
+                    if window[w] != stamp:
+                        w = outside
+                if disc[w] < start:
+                    clock += 1
+                    disc[w] = low[w] = clock
+                    sub[w] = 1
+                    stack.append((w, v, 0))
+                    if w == outside:
+                        border = [e for e in self._edge if not cells[e] and
+                                  any(not cells[n] and window[n] != stamp for n in adjacency[e])]
+                elif w != parent and disc[w] < low[v]:
+                    low[v] = disc[w]
+            else:
+                stack.pop()
+                if parent < 0:
+                    continue
+                if low[v] < low[parent]:
+                    low[parent] = low[v]
+                sub[parent] += sub[v]
+                if parent in wanted and low[v] >= disc[parent]:
+                    pieces[parent].append(v)
+        self._clock = clock
+        nodes = clock - start + 1
+        reached = disc[outside] >= start
+        component = nodes - reached
+        for target in wanted:
+            if disc[target] < start:
+                continue  # in another component
+            chambers = []
+            rest = nodes - 1
+            rest_open = reached
+            for child in pieces[target]:
+                rest -= sub[child]
+                if reached and disc[child] <= disc[outside] < disc[child] + sub[child]:
+                    # the subtree of child holds the outside node, its chamber goes on beyond the window
+                    rest_open = False
+                    chambers.append(outside)
+                else:
+                    chambers.append(sub[child])
+            if target != root and rest > 0:
+                chambers.append(outside if rest_open else rest)
+            self._cache[target] = ChamberInfo(component, chambers)
+        return True
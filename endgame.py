@@ -0,0 +1,315 @@
+import random
+import time
+from array import array
+from functools import lru_cache
+from typing import Optional
+
+from board import Board, FREE
+from regions import may_split
+from util import Deadline
+
+SEARCH_TIME = 0.1  # seconds per tick when the caller gives no deadline
+BOUNDS_COST = 2.0  # first estimate of a _bounds call in a tick, relative to the chamber's hashing
+POCKET_SIZE = 1024  # cells; without time for bounds, moves are told apart by their region up to this size
+MEMO_LIMIT = 1 << 18  # entries, a (cell, 64 bit hash) key and a bound each: some 50 MB at most
+
+
+@lru_cache(maxsize=8)
+def _colors(width: int, height: int) -> bytes:
+    # checkerboard colour per cell; only a proper 2-colouring of the torus if both sides are even
+    return bytes((idx // height + idx % height) & 1 for idx in range(width * height))
+
+
+@lru_cache(maxsize=8)
+def _keys(width: int, height: int) -> list[int]:
+    # random key per cell; a set of free cells is hashed as the xor of their keys
+    rng = random.Random(width * 65536 + height)
+    return [rng.getrandbits(64) for _ in range(width * height)]
+
+
+class EndgameSolver:
+    ###
+    # Longest path through a sealed chamber: once nobody else can reach our region, the
+    # only thing left is to fill as much of it as possible before running into a wall.
+    #   - depth-first search with Warnsdorff move ordering (fewest onward exits first),
+    #     so the first descent already hugs the walls
+    #   - upper bounds from the reachable cells, the checkerboard parity (every step
+    #     changes colour) and dead ends (at most one of them can be entered, as the last cell);
+    #     a fresh bound is only computed when the ring test says the step may split the
+    #     chamber, otherwise the parent's bound minus one is used
+    #   - bounds of searched subtrees are memoized by (cell, free cells left), the free
+    #     cells as a Zobrist-style hash that every step updates with one xor
+    #   - the search stops at the deadline with the best path found so far; bounds are only
+    #     computed while one more still fits, after that a step that may split the chamber
+    #     orders its moves by region sizes counted up to POCKET_SIZE; the next tick continues
+    #     from that path and the memo instead of starting over
+    #   - the chamber hash follows our head with one xor per tick; it is recomputed from
+    #     scratch (to notice cells freed by dying players) only when that fits in half the
+    #     time left, so hashing a large chamber never eats a small budget
+    # The search temporarily claims the cells of its current path on the board itself and
+    # always releases them before returning.
+    def __init__(self, board: Board):
+        self._board = board
+        self._colors = _colors(board.width, board.height)
+        self._keys = _keys(board.width, board.height)
+        self._parity = board.width % 2 == 0 and board.height % 2 == 0
+        self._visited = array('I', bytes(4 * board.width * board.height))
+        self._stamp = 0
+        self._stack = []
+        self._memo = {}
+        self._path = []  # best path found so far, as the cells after our head
+        self._chamber = 0  # hash of the free cells of the chamber the path was searched in
+        self._head = None  # our head when the chamber was last hashed
+        self._hash_cost = 0.0  # seconds the last full hash of the chamber took
+        self._bounds_cost = 0.0  # seconds the next _bounds call is expected to take
+        self._proven = False
+        self.nodes = 0
+
+    @property
+    def path(self) -> list[int]:
+        return self._path
+
+    @property
+    def proven(self) -> bool:
+        return self._proven
+
+    def next_move(self, head: int, deadline: Optional[Deadline] = None) -> Optional[int]:
+        # the cell to move to next, None if no free neighbour is left
+        if deadline is None or deadline.at is None:
+            deadline = Deadline(time.perf_counter(), SEARCH_TIME)
+        board = self._board
+        if self._path and self._path[0] == head and all(board.is_free(c) for c in self._path[1:]):
+            # we followed the plan, continue from where it left off
+            self._path.pop(0)
+        else:
+            self._path = []
+            self._proven = False
+        moved = self._head is not None and head in board.adjacency[self._head]
+        if moved:
+            # one step on from last tick, our head left the chamber
+            self._chamber ^= self._keys[head]
+        self._head = head
+        left = deadline.work_left()
+        if moved and left is not None and 2 * self._hash_cost > left:
+            chamber = self._chamber
+        else:
+            started = time.perf_counter()
+            chamber = self._component_hash(head)
+            self._hash_cost = time.perf_counter() - started
+        # bounds walk the chamber like the hash did, with more work per cell
+        self._bounds_cost = BOUNDS_COST * self._hash_cost
+        if chamber != self._chamber:
+            self._chamber = chamber
+            self._proven = False
+        if not self._proven:
+            self._search(head, deadline)
+        return self._path[0] if self._path else None
+
+    def _search(self, head: int, deadline: Deadline):
+        board = self._board
+        cells = board.cells
+        adjacency = board.adjacency
+        memo = self._memo
+        if len(memo) > MEMO_LIMIT:
+            memo.clear()
+        keys = self._keys
+        mark = cells[head]
+        chamber = self._chamber
+        best = len(self._path)
+        stop_at = deadline.stop_at
+        # bounds tighten the search and keep the first step out of small chambers; they are
+        # skipped when one more would not fit in time
+        if self._bounds_fit(stop_at):
+            bounds = self._timed_bounds(head)
+            root_ub = min(memo.get((head, chamber), len(cells)), max(bounds.values(), default=0))
+        else:
+            bounds = self._pockets(head, stop_at)
+            root_ub = memo.get((head, chamber), len(cells))
+        if best >= root_ub:
+            self._proven = True
+            return
+        best_path = None
+        path = []
+        # frame: [cell, options, next option, memo key, value found so far, upper bound]
+        frames = [[head, self._order(head, bounds), 0, (head, chamber), 0, root_ub]]
+        nodes = 0
+        aborted = False
+        try:
+            while frames:
+                frame = frames[-1]
+                cell, options, i, key, value, ub = frame
+                if i < len(options) and len(path) + ub <= best:
+                    # the rest of this subtree cannot beat the best path any more
+                    frame[2] = i = len(options)
+                    frame[4] = value = ub
+                if i < len(options):
+                    frame[2] = i + 1
+                    nxt = options[i]
+                    nodes += 1
+                    if (best_path is not None or self._path) and stop_at is not None and time.perf_counter() >= stop_at:
+                        # out of time, but never without a move to make
+                        aborted = True
+                        break
+                    cells[nxt] = mark
+                    chamber ^= keys[nxt]
+                    path.append(nxt)
+                    depth = len(path)
+                    if depth > best:
+                        best = depth
+                        best_path = path[:]
+                    child_key = (nxt, chamber)
+                    child_ub = min(ub - 1, memo.get(child_key, ub))
+                    bounds = None
+                    if 0 < child_ub and depth + child_ub > best and may_split(board, nxt):
+                        if self._bounds_fit(stop_at):
+                            bounds = self._timed_bounds(nxt)
+                            child_ub = min(child_ub, max(bounds.values(), default=0))
+                        else:
+                            bounds = self._pockets(nxt, stop_at)
+                    if child_ub > 0 and depth + child_ub > best:
+                        frames.append([nxt, self._order(nxt, bounds), 0, child_key, 0, child_ub])
+                        continue
+                    # leaf, or cannot beat the best path
+                    if 1 + child_ub > value:
+                        frame[4] = 1 + child_ub
+                    cells[nxt] = FREE
+                    chamber ^= keys[nxt]
+                    path.pop()
+                else:
+                    frames.pop()
+                    memo[key] = value
+                    if frames:
+                        parent = frames[-1]
+                        if 1 + value > parent[4]:
+                            parent[4] = 1 + value
+                        cells[cell] = FREE
+                        chamber ^= keys[cell]
+                        path.pop()
+        finally:
+            for c in path:
+                cells[c] = FREE
+        self.nodes += nodes
+        if best_path is not None:
+            self._path = best_path
+        self._proven = not aborted
+
+    def _order(self, cell: int, bounds: Optional[dict[int, int]] = None) -> list[int]:
+        # larger chambers first where the bounds tell them apart, then fewest onward exits
+        cells = self._board.cells
+        adjacency = self._board.adjacency
+        options = [n for n in adjacency[cell] if not cells[n]]
+        if len(options) > 1:
+            if bounds is None:
+                options.sort(key=lambda n: sum(1 for m in adjacency[n] if not cells[m]))
+            else:
+                options.sort(key=lambda n: (-bounds[n], sum(1 for m in adjacency[n] if not cells[m])))
+        return options
+
+    def _next_stamp(self) -> int:
+        self._stamp += 1
+        if self._stamp > 0xFFFFFFFF:
+            self._visited = array('I', bytes(4 * len(self._visited)))
+            self._stamp = 1
+        return self._stamp
+
+    def _component_hash(self, head: int) -> int:
+        # hash of the free cells reachable from head
+        cells = self._board.cells
+        keys = self._keys
+        adjacency = self._board.adjacency
+        visited = self._visited
+        stamp = self._next_stamp()
+        stack = self._stack
+        visited[head] = stamp
+        stack.append(head)
+        chamber = 0
+        while stack:
+            idx = stack.pop()
+            for n in adjacency[idx]:
+                if visited[n] != stamp and not cells[n]:
+                    visited[n] = stamp
+                    chamber ^= keys[n]
+                    stack.append(n)
+        return chamber
+
+    def _bounds_fit(self, stop_at: Optional[float]) -> bool:
+        # whether a node that needs fresh bounds can still be searched
+        return stop_at is None or time.perf_counter() + self._bounds_cost < stop_at
+
+    def _timed_bounds(self, start: int) -> dict[int, int]:
+        started = time.perf_counter()
+        bounds = self._bounds(start)
+        self._bounds_cost = max(self._bounds_cost, time.perf_counter() - started)
+        return bounds
+
+    def _pockets(self, start: int, stop_at: Optional[float]) -> dict[int, int]:
+        # free cells reachable from each free neighbour of start, counted up to POCKET_SIZE
+        # (or, past stop_at, to the next 256): not a bound, but enough to keep the order from
+        # walking into a small pocket
+        cells = self._board.cells
+        adjacency = self._board.adjacency
+        visited = self._visited
+        stack = self._stack
+        sizes = {}
+        for entry in adjacency[start]:
+            if cells[entry] or entry in sizes:
+                continue
+            stamp = self._next_stamp()
+            visited[entry] = stamp
+            stack.append(entry)
+            count = 0
+            while stack and count < POCKET_SIZE:
+                if count and not count & 255 and stop_at is not None and time.perf_counter() >= stop_at:
+                    break
+                idx = stack.pop()
+                count += 1
+                for n in adjacency[idx]:
+                    if visited[n] != stamp and not cells[n]:
+                        visited[n] = stamp
+                        stack.append(n)
+            stack.clear()
+            sizes[entry] = count
+        return sizes
+
+    def _bounds(self, start: int) -> dict[int, int]:
+        # upper bound on the length of a path leaving start (which is taken already),
+        # per free neighbour it could enter first
+        cells = self._board.cells
+        adjacency = self._board.adjacency
+        colors = self._colors
+        visited = self._visited
+        stamp = self._next_stamp()
+        stack = self._stack
+        near = adjacency[start]
+        first = 1 - colors[start]
+        bounds = {}
+        for entry in near:
+            if cells[entry] or entry in bounds:
+                continue
+            # one component per unvisited free neighbour, a path only enters one of them
+            visited[entry] = stamp
+            stack.append(entry)
+            count = 0
+            same = 0
+            dead_ends = 0
+            while stack:
+                idx = stack.pop()
+                count += 1
+                same += colors[idx] == first
+                exits = 0
+                for n in adjacency[idx]:
+                    if not cells[n]:
+                        exits += 1
+                        if visited[n] != stamp:
+                            visited[n] = stamp
+                            stack.append(n)
+                if exits <= 1 and idx not in near:
+                    dead_ends += 1
+            bound = count - max(0, dead_ends - 1)
+            if self._parity:
+                other = count - same
+                bound = min(bound, 2 * min(same, other) + (same > other))
+            for n in near:
+                if visited[n] == stamp and n not in bounds and not cells[n]:
+                    bounds[n] = bound
+        return bounds
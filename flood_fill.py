@@ -0,0 +1,188 @@
+import time
+from array import array
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional
+
+from board import Board
+from util import Deadline
+
+
+class FloodFill:
+    ###
+    # Linear-time flood fill over the wrapping game field.
+    #   - visited cells are stamped into a preallocated buffer that is reused between calls,
+    #     so nothing has to be cleared before a fill
+    #   - the work list is a plain list used as a stack
+    #   - player heads are looked up in a set of flat indices
+    #   - an optional limit stops a fill after that many free cells, counting the heads met so far
+    # Works on Board indices and its precomputed neighbour table.
+    _shared: dict[tuple[int, int], "FloodFill"] = {}
+
+    def __init__(self, width: int, height: int):
+        self._width = width
+        self._height = height
+        self._visited = array('I', bytes(4 * width * height))
+        self._stamp = 0
+        self._stack = []
+
+    @classmethod
+    def shared(cls, width: int, height: int) -> "FloodFill":
+        engine = cls._shared.get((width, height))
+        if engine is None:
+            engine = cls._shared[(width, height)] = cls(width, height)
+        return engine
+
+    def head_set(self, player_positions: dict[int, list[int]]) -> set[int]:
+        height = self._height
+        return {pos[0] * height + pos[1] for pos in player_positions.values()}
+
+    def count(self, board: Board, idx: int, heads: set[int]) -> tuple[int, int]:
+        return self._fill(board, idx, heads, self._next_stamp())
+
+    def count_many(self, board: Board, starts: Iterable[tuple[Hashable, int]],
+                   heads: set[int], limit: Optional[int] = None) -> dict[Hashable, tuple[int, int]]:
+        # Starts that land in a region already filled during this pass reuse its result.
+        first_stamp = self._stamp + 1
+        by_stamp = {}
+        results = {}
+        for key, idx in starts:
+            stamp = self._visited[idx]
+            if stamp >= first_stamp and stamp in by_stamp and board.is_free(idx):
+                results[key] = by_stamp[stamp]
+                continue
+            stamp = self._next_stamp()
+            if stamp < first_stamp:  # buffer was reset, earlier regions are gone
+                first_stamp = stamp
+                by_stamp.clear()
+            by_stamp[stamp] = results[key] = self._fill(board, idx, heads, stamp, limit)
+        return results
+
+    def _next_stamp(self) -> int:
+        self._stamp += 1
+        if self._stamp > 0xFFFFFFFF:
+            self._visited = array('I', bytes(4 * self._width * self._height))
+            self._stamp = 1
+        return self._stamp
+
+    def _fill(self, board: Board, start: int, heads: set[int], stamp: int,
+              limit: Optional[int] = None) -> tuple[int, int]:
+        cells = board.cells
+        adjacency = board.adjacency
+        visited = self._visited
+        stack = self._stack
+        visited[start] = stamp
+        stack.append(start)
+        num_fields = 0
+        player_count = 0
+        while stack:
+            idx = stack.pop()
+            if cells[idx]:
+                if idx in heads:
+                    player_count += 1
+                continue
+            num_fields += 1
+            if num_fields == limit:
+                stack.clear()
+                break
+            for n in adjacency[idx]:
+                if visited[n] != stamp:
+                    visited[n] = stamp
+                    stack.append(n)
+        return num_fields, player_count
+
+
+CACHE_ENTRIES = 256
+
+
+class FillCache:
+    ###
+    # Memoized flood-fill counts, one entry per region of free cells.
+    #   - every free cell points to the entry of the region it was last counted in, so a start
+    #     anywhere inside a counted region is a lookup
+    #   - an entry keeps the region size and its border (the taken cells around it); heads
+    #     move every tick, so the bordering heads are recounted from the border on every hit
+    #   - touch() drops only the entries next to a cell that was taken or freed, regions
+    #     elsewhere stay cached; the least recently used entries are evicted past max_entries
+    # Same (num_fields, player_count) contract as FloodFill.count.
+    def __init__(self, width: int, height: int, max_entries: int = CACHE_ENTRIES):
+        self._size = width * height
+        self._entry_at = array('I', bytes(4 * self._size))  # 0 = no entry
+        self._entries = OrderedDict()  # id -> (num_fields, border)
+        self._next_id = 1
+        self._max_entries = max_entries
+        self._stack = []
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.miss_time = 0.0
+
+    def touch(self, board: Board, idx: int):
+        # call after cell idx was taken or freed
+        self._drop(self._entry_at[idx])
+        for n in board.adjacency[idx]:
+            self._drop(self._entry_at[n])
+
+    def count(self, board: Board, idx: int, heads: set[int]) -> tuple[int, int]:
+        if not board.is_free(idx):
+            return 0, int(idx in heads)
+        entry = self._entries.get(self._entry_at[idx])
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(self._entry_at[idx])
+        else:
+            self.misses += 1
+            start = time.perf_counter()
+            entry = self._fill(board, idx)
+            self.miss_time += time.perf_counter() - start
+        num_fields, border = entry
+        return num_fields, len(heads & border)
+
+    def count_many(self, board: Board, starts: Iterable[tuple[Hashable, int]],
+                   heads: set[int], deadline: Optional[Deadline] = None) -> dict[Hashable, tuple[int, int]]:
+        # starts not reached before the deadline are left out
+        results = {}
+        for key, idx in starts:
+            if deadline is not None and deadline.expired():
+                break
+            results[key] = self.count(board, idx, heads)
+        return results
+
+    def stats(self) -> dict:
+        saved = self.hits * self.miss_time / self.misses if self.misses else 0.0
+        return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                "evictions": self.evictions, "entries": len(self._entries), "saved_ms": saved * 1000}
+
+    def _drop(self, entry_id: int):
+        if self._entries.pop(entry_id, None) is not None:
+            self.invalidations += 1
+
+    def _fill(self, board: Board, start: int) -> tuple[int, set[int]]:
+        if self._next_id > 0xFFFFFFFF:
+            self._entry_at = array('I', bytes(4 * self._size))
+            self._entries.clear()
+            self._next_id = 1
+        entry_id = self._next_id
+        self._next_id += 1
+        cells = board.cells
+        adjacency = board.adjacency
+        entry_at = self._entry_at
+        stack = self._stack
+        border = set()
+        entry_at[start] = entry_id
+        stack.append(start)
+        num_fields = 0
+        while stack:
+            idx = stack.pop()
+            num_fields += 1
+            for n in adjacency[idx]:
+                if cells[n]:
+                    border.add(n)
+                elif entry_at[n] != entry_id:
+                    entry_at[n] = entry_id
+                    stack.append(n)
+        entry = self._entries[entry_id] = (num_fields, border)
+        if len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry
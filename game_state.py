@@ -1,13 +1,37 @@
-import queue
+import logging
 import random
-from typing import Optional
+import time
+from array import array
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
 
-from util import Direction, MoveReason, Path, Position
-from ui import GUI
+from bitboard import BitBoard
+from board import Board
+from chambers import ChamberAnalysis, ChamberInfo
+from endgame import EndgameSolver
+from flood_fill import FillCache, FloodFill
+from metrics import Metrics, Timer
+from regions import RegionIndex, may_split
+from renderer import Renderer
+from search import LOSS, LookaheadSearch
+from territory import TerritoryEvaluator
+from util import Deadline, Direction, MoveReason, Position
+
+if TYPE_CHECKING:
+    from parallel import ParallelEvaluator, PendingSearch  # imported by the caller only when workers are used
+
+log = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def _random_messages() -> tuple[str, ...]:
+    # read once per process, every game and session picks from the same lines
+    with open("random_messages.txt") as f:
+        return tuple(f.readlines())
 
 
 class FieldCountAlgo:
-    def count_fields(self, field: list[list[int]], x: int, y: int, width: int, height: int) -> dict[Direction, int]:
+    def count_fields(self, field: Board, x: int, y: int, width: int, height: int) -> dict[Direction, int]:
         self.already_counted = []
         self.field = field
         self.width = width
@@ -34,28 +58,10 @@ class FieldCountAlgo:
     #   8. Return.
 
     @staticmethod
-    def flood_fill_count(field: list[list[int]], x: int, y: int, width: int, height: int,
+    def flood_fill_count(field: Board, x: int, y: int, width: int, height: int,
                          player_positions: dict[int, list[int]]):
-        q = queue.Queue()
-        q.put((x, y))
-        num_fields = 0
-        player_count = 0
-        already_checked = []
-        while not q.empty():
-            n = q.get()
-            if field[n[0]][n[1]] is None:
-                num_fields += 1
-                for direc in Direction:
-                    new_x = direc.get_x(n[0], width)
-                    new_y = direc.get_y(n[1], height)
-                    coords_hash = new_x + new_y * width
-                    if coords_hash not in already_checked:
-                        q.put([new_x, new_y])
-                        already_checked.append(coords_hash)
-            else:
-                if n in player_positions.values():
-                    player_count += 1
-        return num_fields, player_count
+        engine = FloodFill.shared(width, height)
+        return engine.count(field, field.index(x, y), engine.head_set(player_positions))
 
     def _count_neighbors(self, x: int, y: int) -> int:
         num = 0
@@ -67,85 +73,210 @@ class FieldCountAlgo:
                 num += 1
                 num += self._count_neighbors(new_x, new_y)
             else:
-                print("field at %i/%i is not countable!" % (new_x, new_y))
+                log.debug("field at %i/%i is not countable!", new_x, new_y)
         return num
 
     def _is_countable(self, x: int, y: int):
         if "%i|%i" % (x, y) in self.already_counted:
             return False
-        return self.field[x][y] is None
+        return self.field.is_free(self.field.index(x, y))
+
+
+FILL_ALGOS = ["regions", "bfs", "bitboard"]
+LOOKAHEAD_RADIUS = 4  # opponents whose head is at most this many steps away are searched
+LOOKAHEAD_OPPONENTS = 2
+TERRITORY_CELL_COST = 1e-6  # seconds per board cell, the territory estimate until one has been measured
 
 
 class GameState:
-    def __init__(self, width: int, height: int, own_playerid: int):
+    def __init__(self, width: int, height: int, own_playerid: int, renderer: Optional[Renderer] = None,
+                 fill_algo: str = "regions", pool: Optional["ParallelEvaluator"] = None,
+                 metrics: Optional[Metrics] = None):
+        # pool is the connection's ParallelEvaluator, if the lookahead runs in worker processes
         assert isinstance(width, int)
         assert isinstance(height, int)
         assert isinstance(own_playerid, int)
         self._own_playerid = own_playerid
         self._game_width = width
         self._game_height = height
-        self._grid = [[None] * height for _ in range(width)]
+        self._pool = pool
+        self._board = Board(width, height, pool.start_game(width, height) if pool is not None else None)
         self._current_dir = Direction.UP
         self._last_positions = {}
+        self._head_at = {}
+        self._trails = {}
+        self._removed = set()
         self._field_count = FieldCountAlgo()
+        self._flood_fill = FloodFill(width, height)
+        self._regions = RegionIndex(width, height)
+        self._chambers = ChamberAnalysis(width, height)
+        self._endgame = EndgameSolver(self._board)
+        self._lookahead = LookaheadSearch(self._board)
+        assert fill_algo in FILL_ALGOS
+        self._fill_algo = fill_algo
+        self._bitboard = BitBoard(width, height) if fill_algo == "bitboard" else None
+        self._fill_cache = FillCache(width, height) if fill_algo == "bfs" else None
+        self._territory = TerritoryEvaluator(self._board) if TerritoryEvaluator.available() else None
+        # seconds the last territory evaluation took
+        self._territory_cost = width * height * TERRITORY_CELL_COST
         self._last_message_tick = 0
         self.boxed_in = False
         self._tick = 0
-        self._ui = GUI(self._game_width, self._game_height)
-        self._move_reasons = [[None] * height for _ in range(width)]
+        self._ui = renderer if renderer is not None else Renderer()
+        self._metrics = metrics if metrics is not None else Metrics()
 
 
     def update_player_pos(self, playerid: int, pos_x: int, pos_y: int):
-        # assert self._grid[pos_x][pos_y] is None
-        self._grid[pos_x][pos_y] = playerid
+        # assert self._board.is_free(self._board.index(pos_x, pos_y))
+        if playerid in self._removed:
+            return  # pos arrived after the player's die
+        idx = self._board.index(pos_x, pos_y)
+        old = self._last_positions.get(playerid)
+        if old is not None:
+            old_idx = self._board.index(old[0], old[1])
+            if self._head_at.get(old_idx) == playerid:
+                del self._head_at[old_idx]
+        self._head_at[idx] = playerid
+        if self._board.is_free(idx):
+            self._board.claim(idx, playerid)
+            self._trails.setdefault(playerid, []).append(idx)
+            self._regions.block(self._board, idx)
+            self._chambers.touch(self._board, idx)
+            self._lookahead.block(idx)
+            if self._bitboard is not None:
+                self._bitboard.block(idx)
+            if self._fill_cache is not None:
+                self._fill_cache.touch(self._board, idx)
+            self._ui.add_cell(pos_x, pos_y, playerid)
         self._last_positions[playerid] = [pos_x, pos_y]
 
+    def update_player_positions(self, positions: list[tuple[int, int, int]]):
+        for playerid, pos_x, pos_y in positions:
+            self.update_player_pos(playerid, pos_x, pos_y)
+
+    def _own_idx(self) -> int:
+        pos = self._last_positions[self._own_playerid]
+        return self._board.index(pos[0], pos[1])
+
     def _will_collide(self, dir: Direction):
-        pos_x = self._last_positions[self._own_playerid][0]
-        pos_y = self._last_positions[self._own_playerid][1]
-        field = self._get_field_at(pos_x, pos_y, dir)
-        print("Field at %i/%i at dir %s is %s" % (pos_x, pos_y, dir.value, str(field)))
+        own = self._own_idx()
+        field = self._get_field_at(own, dir)
+        log.debug("Field at %i/%i at dir %s is %s", *self._board.coords(own), dir.value, field)
         return field is not None
 
-    def _get_player_at(self, x: int, y: int):
-        for key, val in self._last_positions.items():
-            if val == [x, y]:
-                return key
-        return None
+    def _get_player_at(self, idx: int):
+        return self._head_at.get(idx)
+
+    def _is_player_at(self, idx: int):
+        return self._get_player_at(idx) not in [None, self._own_playerid]
 
-    def _is_player_at(self, x: int, y: int):
-        return self._get_player_at(x, y) not in [None, self._own_playerid]
+    def _is_player_near(self, idx: int):
+        for n in self._board.adjacency[idx]:
+            if self._is_player_at(n):
+                return True
+        return False
 
-    def _is_player_near(self, x: int, y: int):
-        return True in [
-            self._is_player_at(d.get_x(x, self._game_width), d.get_y(y, self._game_height))
-            for d in Direction
-        ]
+    def _nearby_opponents(self, own: int) -> list[int]:
+        # the closest opponents within LOOKAHEAD_RADIUS steps, measured around the torus
+        x, y = self._board.coords(own)
+        near = []
+        for pid, pos in self._last_positions.items():
+            if pid == self._own_playerid:
+                continue
+            dx = abs(pos[0] - x)
+            dy = abs(pos[1] - y)
+            dist = min(dx, self._game_width - dx) + min(dy, self._game_height - dy)
+            if dist <= LOOKAHEAD_RADIUS:
+                near.append((dist, pid))
+        return [pid for _, pid in sorted(near)[:LOOKAHEAD_OPPONENTS]]
 
     def get_own_pos(self):
         pos_x = self._last_positions[self._own_playerid][0]
         pos_y = self._last_positions[self._own_playerid][1]
         return Position(pos_x, pos_y, self._game_width, self._game_height)
 
-    def should_do_floodfill(self):
-        floodfill_check_fields = [
-            Path(Direction.LEFT, Direction.UP), Path(Direction.RIGHT, Direction.UP),
-            Path(Direction.LEFT, Direction.DOWN), Path(Direction.RIGHT, Direction.DOWN),
-        ]
-        fields = [
-            self._grid[resolved.x][resolved.y] is not None for resolved in [path.resolve(self.get_own_pos()) for path in floodfill_check_fields]
-        ]
-        fields_set = 0
-        for field in fields:
-            if field:
-                fields_set += 1
-        return fields_set >= 2
-    def get_move(self, stick: int) -> Optional[tuple[Direction, str]]:
-        pos_x = self._last_positions[self._own_playerid][0]
-        pos_y = self._last_positions[self._own_playerid][1]
+    def should_do_floodfill(self, deadline: Optional[Deadline] = None):
+        # only worth evaluating when our moves lead into different chambers, or when the
+        # analysis could not tell before the deadline
+        own = self._own_idx()
+        targets = [n for n in self._board.adjacency[own] if self._board.is_free(n)]
+        # the ring test keeps most ticks from relabelling a dirty region, which on a large
+        # open board takes longer than a whole tick
+        if may_split(self._board, own) and len({self._regions.region_at(self._board, n) for n in targets}) > 1:
+            return True
+        cut_moves = self._cut_moves(own, deadline)
+        return cut_moves is None or len(cut_moves) > 0
+
+    def _cut_moves(self, own: int, deadline: Optional[Deadline] = None) -> Optional[dict[int, ChamberInfo]]:
+        # moves (by target cell) that cut off a chamber near our head, None if the deadline
+        # passed before the analysis finished
+        with Timer(self._metrics, "chambers"):
+            infos = self._chambers.analyze(self._board, own, self._board.adjacency[own], deadline)
+        if infos is None:
+            return None
+        return {idx: info for idx, info in infos.items() if info.cuts}
+
+    def start_search(self, deadline: Deadline) -> Optional["PendingSearch"]:
+        # the lookahead of get_move, started in the worker pool; pass the result to get_move,
+        # which scores the moves in this process while the workers search
+        if self._pool is None or self.boxed_in or self._own_playerid not in self._last_positions:
+            return None
+        own = self._own_idx()
+        opponents = self._nearby_opponents(own)
+        moves = [n for n in self._board.adjacency[own] if self._board.is_free(n)]
+        if not opponents or not moves:
+            return None
+        heads = {pid: self._board.index(*pos) for pid, pos in self._last_positions.items()}
+        return self._pool.submit(self._own_playerid, heads, opponents, moves, self._lookahead.key, deadline)
+
+    def _count_fields(self, starts: list[tuple[Direction, int]],
+                      deadline: Optional[Deadline] = None) -> dict[Direction, tuple[int, int]]:
+        # (num_fields, player_count) per start with the selected algorithm, all of them agree;
+        # starts not reached before the deadline are missing
+        if self._fill_algo == "regions":
+            return self._regions.query_many(self._board, starts, self._last_positions, deadline)
+        heads = self._flood_fill.head_set(self._last_positions)
+        if self._fill_algo == "bitboard":
+            return self._bitboard.count_many(starts, heads, deadline)
+        return self._fill_cache.count_many(self._board, starts, heads, deadline)
+
+    def _out_of_time(self, deadline: Deadline) -> bool:
+        # checked before every expensive phase of get_move
+        if not deadline.expired():
+            return False
+        log.info("Tick budget exhausted, keeping best move so far")
+        self._metrics.count("budget_exhausted")
+        return True
+
+    def fill_cache_stats(self) -> Optional[dict]:
+        # hit/miss counters of the flood-fill cache, None unless fill_algo is "bfs"
+        return self._fill_cache.stats() if self._fill_cache is not None else None
+
+    def _fallback_move(self) -> Direction:
+        # cheap answer that is available before any deeper evaluation ran
+        own = self._own_idx()
+        options = [self._current_dir, self._current_dir.rotate_ccw(), self._current_dir.rotate_cw()]
+        free = [d for d in options if self._get_field_at(own, d) is None]
+        for direc in free:
+            if not self._is_player_near(self._board.step(own, direc)):
+                return direc
+        if free:
+            return free[0]
+        return self._current_dir
+
+    def get_move(self, stick: int, deadline: Optional[Deadline] = None,
+                 lookahead: Optional["PendingSearch"] = None) -> Optional[tuple[Direction, str]]:
+        # lookahead is this tick's start_search, its result replaces the search in here
+        if self._own_playerid not in self._last_positions:
+            if lookahead is not None:
+                lookahead.cancel()
+            return None, None  # we are dead or the server did not send our position yet
+        if deadline is None:
+            deadline = Deadline(0, None)
+        own = self._own_idx()
         max_fields = 0
-        max_dir = Direction.UP
-        move_reason = MoveReason.UNKNOWN
+        max_dir = self._fallback_move()
+        move_reason = MoveReason.FALLBACK
         max_players = 0
         message = None
         dirs = [d for d in Direction]
@@ -154,7 +285,6 @@ class GameState:
             random.shuffle(dirs)
         # last_char = getchar()
         last_char = None
-        print(f"using preferred key {last_char}")
         if last_char == "w":
             dirs = [Direction.UP, *dirs]
         elif last_char == "a":
@@ -165,95 +295,182 @@ class GameState:
             dirs = [Direction.RIGHT, *dirs]
         could_collide_dirs = set()
         will_collide_dirs = set()
+        timed_out = False
+        searched = False
         self._ui.wm_title("_")
         if self.boxed_in:
-            # follow wall(s)
+            # fill the sealed chamber along the longest path found in the time we have
             self._ui.wm_title("boxed in!")
-            relative_left = self._current_dir.rotate_ccw()
-            if not self._will_collide(relative_left):
-                max_dir = relative_left
-            elif not self._will_collide(self._current_dir):
-                max_dir = self._current_dir
+            with Timer(self._metrics, "endgame"):
+                target = self._endgame.next_move(own, deadline)
+            if target is not None:
+                max_dir = next(d for d in Direction if self._board.step(own, d) == target)
             else:
-                max_dir = self._current_dir.rotate_cw()
+                # follow wall(s)
+                relative_left = self._current_dir.rotate_ccw()
+                if not self._will_collide(relative_left):
+                    max_dir = relative_left
+                elif not self._will_collide(self._current_dir):
+                    max_dir = self._current_dir
+                else:
+                    max_dir = self._current_dir.rotate_cw()
             move_reason = MoveReason.BOXED
-        elif not self.should_do_floodfill() and not self._will_collide(self._current_dir) and not self._is_player_near(self._current_dir.get_x(pos_x, self._game_width), self._current_dir.get_y(pos_y, self._game_height)):
+        elif not self._will_collide(self._current_dir) and not self._is_player_near(self._board.step(own, self._current_dir)) and not self._nearby_opponents(own) and not self.should_do_floodfill(deadline):
             max_dir = self._current_dir
             move_reason = MoveReason.CONTINUE
         else:
+            candidates = []
             for direc in dirs:
                 if self._will_collide(direc):
                     will_collide_dirs.add(direc)
-                    print(f"Not moving {direc} beacuse i would collide with myself!")
+                    log.debug("Not moving %s beacuse i would collide with myself!", direc.name)
                     continue
-                new_x = direc.get_x(pos_x, self._game_width)
-                new_y = direc.get_y(pos_y, self._game_height)
-                amount, amount_players = FieldCountAlgo.flood_fill_count(self._grid, new_x, new_y, self._game_width,
-                                                                         self._game_height, self._last_positions)
-                print("%s has %i neighbors with %i players" % (direc.name, amount, amount_players))
-                could_collide = self._is_player_near(new_x, new_y)
+                candidates.append((direc, self._board.step(own, direc)))
+            # every phase below is skipped once the deadline passed, whatever was counted is used
+            counts = {}
+            timed_out = self._out_of_time(deadline)
+            if not timed_out:
+                with Timer(self._metrics, "flood_fill"):
+                    counts = self._count_fields(candidates, deadline)
+                timed_out = self._out_of_time(deadline)
+            if not timed_out:
+                cut_moves = self._cut_moves(own, deadline) or {}
+                for direc, new_idx in candidates:
+                    if new_idx in cut_moves:
+                        # entering a cut cell leaves only one of its chambers usable
+                        counts[direc] = (min(counts[direc][0], cut_moves[new_idx].usable), counts[direc][1])
+            viable = []
+            for direc, new_idx in candidates:
+                if direc not in counts:
+                    continue
+                amount, amount_players = counts[direc]
+                log.debug("%s has %i neighbors with %i players", direc.name, amount, amount_players)
+                could_collide = self._is_player_near(new_idx)
                 if could_collide:
                     could_collide_dirs.add(direc)
                     #print("Not moving to %s because we could collide with another player!" % direc.name)
                     continue
-                if amount > max_fields:
+                viable.append((direc, new_idx))
+                score = amount / (1 + amount_players)
+                if score > max_fields:
                     max_dir = direc
                     move_reason = MoveReason.FLOOD_FILL
-                    max_fields = amount / (1 + amount_players)
+                    max_fields = score
                     max_players = amount_players
-                if max_fields >= 1000:
-                    break
-            if max_players == 1:  # myself
+            if not timed_out:
+                timed_out = self._out_of_time(deadline)
+            left = deadline.work_left()
+            if (self._territory is not None and len(viable) > 1 and not timed_out
+                    and (left is None or left > self._territory_cost)):
+                started = time.perf_counter()
+                with Timer(self._metrics, "territory"):
+                    won = self._territory.cells_won(self._own_playerid, self._last_positions, viable, deadline)
+                self._territory_cost = time.perf_counter() - started
+                if won is None:
+                    # stopped at the deadline, it takes longer than what was left
+                    self._territory_cost *= 2
+                    timed_out = self._out_of_time(deadline)
+                else:
+                    log.debug("territory: %s", won)
+                    best = max(viable, key=lambda c: (won[c[0]], counts[c[0]][0]))[0]
+                    if won[best] > won[max_dir]:
+                        max_dir = best
+                        move_reason = MoveReason.TERRITORY
+                        max_players = counts[best][1]
+                        max_fields = counts[best][0] / (1 + max_players)
+            opponents = self._nearby_opponents(own)
+            result = None
+            if lookahead is not None:
+                # the workers searched while everything above ran
+                with Timer(self._metrics, "search_wait"):
+                    result = lookahead.result(deadline)
+                lookahead = None
+            if not timed_out:
+                timed_out = self._out_of_time(deadline)
+            if result is None and self._pool is None and opponents and not timed_out:
+                # head-on situations: look a few moves ahead, assuming the nearest opponents play against us
+                heads = {pid: self._board.index(*pos) for pid, pos in self._last_positions.items()}
+                with Timer(self._metrics, "search"):
+                    result = self._lookahead.search(self._own_playerid, heads, opponents, deadline)
+            if result is not None and result.value > LOSS and result.move in {idx for _, idx in candidates}:
+                log.debug("lookahead: %i rounds, value %.2f", result.depth, result.value)
+                max_dir = next(d for d in Direction if self._board.step(own, d) == result.move)
+                move_reason = MoveReason.LOOKAHEAD
+                max_fields, max_players = counts.get(max_dir, (0, 0))
+                max_fields /= 1 + max_players
+                searched = True
+            if max_players == 1 and not timed_out:  # myself
                 message = "I'm trapped!"
                 self.boxed_in = True
-            if max_fields <= 20:
+            if max_fields <= 20 and not timed_out:
                 message = "shit..."
         if message is None and self._tick - self._last_message_tick >= 100:
-            message = random.choice(open("random_messages.txt").readlines())
+            message = random.choice(_random_messages())
             self._last_message_tick = self._tick
-        if len(could_collide_dirs) + len(will_collide_dirs) == 4:
-            print("All options are bad")
+        if not timed_out and not searched and len(could_collide_dirs) + len(will_collide_dirs) == 4:
+            log.debug("All options are bad")
             message = "This is close!"
             if len(could_collide_dirs) == 0:
                 message = "see ya!"
             else:
                 move_reason = MoveReason.RANDOM
                 max_dir = random.choice(list(could_collide_dirs))
-        print("decided to move %s" % max_dir.name)
-        pos_x = self._last_positions[self._own_playerid][0]
-        pos_y = self._last_positions[self._own_playerid][1]
-        self._move_reasons[max_dir.get_x(pos_x, self._game_width)][max_dir.get_y(pos_y, self._game_height)] = move_reason.value
+        if lookahead is not None:
+            lookahead.cancel()  # not needed by the branch taken
+        log.debug("decided to move %s", max_dir.name)
+        self._metrics.move_reason(move_reason)
+        reason = (*self._board.coords(self._board.step(own, max_dir)), move_reason.value)
         self._current_dir = max_dir
-        self._ui.update_game(self._last_positions, self._grid, self._own_playerid, could_collide_dirs, max_dir, self._move_reasons)
+        with Timer(self._metrics, "render"):
+            self._ui.update_game(self._last_positions, self._own_playerid, could_collide_dirs, max_dir, reason)
         return max_dir, message
 
         # if chosen is not None:
         #    self._current_dir = chosen
         # return chosen
 
-    def _get_field_at(self, x: int, y: int, dir: Direction) -> int:
-        if dir == Direction.LEFT:
-            return self._grid[(x - 1) % self._game_width][y]
-        elif dir == Direction.RIGHT:
-            return self._grid[(x + 1) % self._game_width][y]
-        elif dir == Direction.UP:
-            return self._grid[x][(y - 1) % self._game_height]
-        elif dir == Direction.DOWN:
-            return self._grid[x][(y + 1) % self._game_height]
+    def _get_field_at(self, idx: int, dir: Direction) -> Optional[int]:
+        return self._board.owner(self._board.step(idx, dir))
 
     def remove_player(self, player_id: int):
-        self._last_positions.pop(player_id)
-        for row in range(self._game_height):
-            for col in range(self._game_width):
-                if self._grid[row][col] == player_id:
-                    self._grid[row][col] = None
+        self._removed.add(player_id)
+        head = self._last_positions.pop(player_id, None)
+        if head is not None:
+            head_idx = self._board.index(head[0], head[1])
+            if self._head_at.get(head_idx) == player_id:
+                del self._head_at[head_idx]
+        self._ui.remove_player(player_id)
+        for idx in self._trails.pop(player_id, []):
+            if self._board.owner(idx) == player_id:
+                self._board.release(idx)
+                self._regions.free(self._board, idx)
+                self._chambers.touch(self._board, idx)
+                self._lookahead.free(idx)
+                if self._bitboard is not None:
+                    self._bitboard.free(idx)
+                if self._fill_cache is not None:
+                    self._fill_cache.touch(self._board, idx)
+
+    def snapshot(self) -> dict:
+        # the board as plain data, for debugging a tick outside the game
+        return {
+            "width": self._game_width,
+            "height": self._game_height,
+            "own_playerid": self._own_playerid,
+            "tick": self._tick,
+            "current_dir": self._current_dir.value,
+            "boxed_in": self.boxed_in,
+            "heads": {str(pid): pos for pid, pos in self._last_positions.items()},
+            "removed": sorted(self._removed),
+            "cells": list(self._board.cells),  # x * height + y, 0 = free, otherwise player id + 1
+        }
 
     def __repr__(self):
         data = ""
-        for row in range(self._game_width):
+        for row in range(self._game_height):
             row_str = ""
-            for col in range(self._game_height):
-                field = self._grid[col][row]
+            for col in range(self._game_width):
+                field = self._board.owner(self._board.index(col, row))
                 rep = " "
                 if field == self._own_playerid:
                     rep = "*"
@@ -265,3 +482,18 @@ class GameState:
 
     def remove_self(self):
         self.remove_player(self._own_playerid)
+
+    def restore(self, tick: int, current_dir: Direction, boxed_in: bool, last_message_tick: int):
+        # what get_move carries from one tick to the next, for replays that rebuild a game without it
+        self._tick = tick
+        self._current_dir = current_dir
+        self.boxed_in = boxed_in
+        self._last_message_tick = last_message_tick
+
+    def close(self):
+        self._ui.close()
+        if self._pool is not None:
+            # let go of every view on the shared cells, the pool reuses them for the next game
+            self._territory = None
+            self._board.cells = array('H', self._board.cells)
+            self._pool = None
@@ -1,104 +1,231 @@
+import time
+
+_STARTED = time.perf_counter()
+
 import argparse
 import asyncio
+import logging
 import socket
-import sys
-import time
+from typing import TYPE_CHECKING
 
-from click import getchar
+from metrics import LOG_LEVELS, Metrics, setup_logging
+from renderer import RENDERERS, create_renderer
+from util import Deadline
 
-from game_state import GameState
+if TYPE_CHECKING:
+    # imported at startup only when --profile-slow-ms or --record asks for them
+    from profiler import SlowTickProfiler
+    from recorder import Recorder
+
+log = logging.getLogger(__name__)
 
 random_messages = ["Running on python", "...", "powered by mate", "meow", "The cake is a lie", "speed 2X"]
 
 
 
+RECV_BUFFER = 64 * 1024
+
+
 class ConnectionContext:
-    def __init__(self, dns, port):
+    def __init__(self, dns, port, tick_budget: float = None, renderer: str = "gui", fill_algo: str = "regions",
+                 workers: int = 0, metrics: Metrics = None, profiler: "SlowTickProfiler" = None,
+                 recorder: "Recorder" = None, username: str = None, password: str = None):
         # ip = socket.getaddrinfo(dns, None, socket.AF_INET6)[0][4][0]
         # print("Resolved IP: %s" % str(ip))
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._sock.connect((dns, port))
-        print("Connected!")
-        self._connected = True
-        self._username = open('username.txt').read().splitlines()[0]
-        self._password = open('password.txt').read().splitlines()[0]
-        self._loop = asyncio.get_event_loop()
+        self._dns = dns
+        self._port = port
+        self._reader = None
+        self._writer = None
+        self._connected = False
+        # a single client reads its account from username.txt/password.txt, multi.py passes one per session
+        self._username = username if username is not None else open('username.txt').read().splitlines()[0]
+        self._password = password if password is not None else open('password.txt').read().splitlines()[0]
+        self._log = log.getChild(self._username) if username is not None else log
         self._state = None
         self._tick = 0
+        self._tick_budget = tick_budget
+        self._renderer = renderer
+        self._fill_algo = fill_algo
+        self._workers = workers
+        self._pool = None  # ParallelEvaluator shared by all games of this connection
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._profiler = profiler
+        self._recorder = recorder
+        self._games = 0
+        self._pending_pos = []
+        self._out = bytearray()
+        self._handlers = {
+            b"motd": self._on_motd,
+            b"error": self._on_error,
+            b"message": self._on_message,
+            b"die": self._on_die,
+            b"lose": self._on_lose,
+            b"tick": self._on_tick,
+            b"game": self._on_game,
+            b"pos": self._on_pos,
+        }
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self._dns, self._port, limit=RECV_BUFFER)
+        sock = self._writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._log.info("Connected!")
+        self._connected = True
 
     async def client_loop(self):
-        msg_buf = ""
+        buf = bytearray()
         while self._connected:
-            data = await self._loop.sock_recv(self._sock, 1024)
+            data = await self._reader.read(RECV_BUFFER)
+            received = time.perf_counter()
             if not data:
                 self._connected = False
                 return
-            # print("Got msg: %s" % data.decode('utf8'))
-            msgs = (msg_buf + data.decode('utf8')).split("\n")
-            msg_buf = ""
-            if len(msgs[-1]) != 0:
-                msg_buf = msgs[-1]
-            for msg in msgs[:-1]:
-                await self.handle_msg(msg)
-
-    async def handle_msg(self, msg):
+            buf += data
+            end = buf.rfind(b"\n")
+            if end < 0:
+                continue
+            # decoding happens per complete line, so multi-byte characters can't be split
+            lines = bytes(buf[:end]).split(b"\n")
+            del buf[:end + 1]
+            for line in lines:
+                await self.handle_msg(line, received)
+
+    async def handle_msg(self, msg: bytes, received: float = None):
         #print(f"< {msg}")
-        code = msg.split('|')[0]
-        args = msg.split('|')[1:]
-        if code == "motd":
-            print("MOTD: %s" % args[0])
-            await self._join()
-        elif code == "error":
-            print("ERROR FROM UPSTREAM: %s" % (str(args)), file=sys.stderr)
-        elif code == "message":
-            pass  # Wtf we want to ignore messages
-        elif code == "die":
-            self._state.boxed_in = False
-            for player_id in args:
-                print("Removing player %i" % int(player_id))
-                self._state.remove_player(int(player_id))
-        elif code == "lose":
+        if self._profiler is not None:
+            self._profiler.start()
+        code, _, rest = msg.partition(b"|")
+        args = rest.split(b"|") if rest else []
+        if self._recorder is not None:
+            self._recorder.received(code, args, received if received is not None else time.perf_counter())
+        if code != b"pos" and self._pending_pos:
+            # pos lines are applied as one batch right before whatever follows them
+            self._state.update_player_positions(self._pending_pos)
+            self._pending_pos = []
+        handler = self._handlers.get(code)
+        if handler is None:
+            self._log.warning("Unknown code %s: %s", code.decode('utf8', 'replace'), args)
+            return
+        await handler(args, received)
+
+    async def _on_motd(self, args: list[bytes], received: float):
+        self._log.info("MOTD: %s", args[0].decode('utf8', 'replace'))
+        await self._join()
+
+    async def _on_error(self, args: list[bytes], received: float):
+        self._log.error("ERROR FROM UPSTREAM: %s", [a.decode('utf8', 'replace') for a in args])
+
+    async def _on_message(self, args: list[bytes], received: float):
+        pass  # Wtf we want to ignore messages
+
+    async def _on_die(self, args: list[bytes], received: float):
+        if self._state is None:
+            return
+        self._state.boxed_in = False
+        for player_id in args:
+            self._log.info("Removing player %i", int(player_id))
+            self._state.remove_player(int(player_id))
+
+    async def _on_lose(self, args: list[bytes], received: float):
+        if self._state is not None:
             self._state.remove_self()
-            print("LOST", file=sys.stderr)
-            #time.sleep(10000)
-        elif code == "tick":
-            if self._state is not None:
-                self._tick += 1
-                move_dir, message = self._state.get_move(self._tick)
-                if message is not None:
-                    await self._send("chat", [message])
-                if move_dir is not None:
-                    print("moving to %s" % move_dir.name)
-                    await self._send("move", [move_dir.value])
-        elif code == "game":
-            self._tick = 0
-            width = int(args[0])
-            height = int(args[1])
-            own_player_id = int(args[2])
-            self._state = GameState(width, height, own_player_id)
-            print("Got game state!")
-        elif code == "pos":
-            player_id = int(args[0])
-            x = int(args[1])
-            y = int(args[2])
-            self._state.update_player_pos(player_id, x, y)
-        else:
-            print("Unknown code %s: %s" % (code, str(args)))
+        self._log.warning("LOST")
+        #time.sleep(10000)
+
+    async def _on_tick(self, args: list[bytes], received: float):
+        if self._state is None:
+            return
+        self._tick += 1
+        deadline = Deadline(received if received is not None else time.perf_counter(), self._tick_budget)
+        # the worker pool searches while get_move scores the moves in this process
+        lookahead = self._state.start_search(deadline)
+        start = time.perf_counter()
+        move_dir, message = self._state.get_move(self._tick, deadline, lookahead)
+        self._metrics.observe("get_move", time.perf_counter() - start)
+        if self._recorder is not None:
+            self._recorder.decided(self._state.boxed_in)
+        if message is not None:
+            self._queue("chat", [message])
+        if move_dir is not None:
+            self._log.debug("moving to %s", move_dir.name)
+            self._queue("move", [move_dir.value])
+        await self._flush()
+        self._metrics.observe("tick", deadline.elapsed())
+        slack = deadline.remaining()
+        if slack is not None and slack < 0:
+            self._metrics.count("late_ticks")
+            self._log.warning("tick %i: %.1fms late", self._tick, -slack * 1000)
+        self._metrics.end_tick(self._tick)
+        if self._profiler is not None:
+            self._profiler.finish(self._games, self._tick, deadline.elapsed(), self._state.snapshot)
+
+    async def _on_game(self, args: list[bytes], received: float):
+        self._tick = 0
+        width = int(args[0])
+        height = int(args[1])
+        own_player_id = int(args[2])
+        if self._state is not None:
+            self._state.close()
+        from game_state import GameState
+        self._state = GameState(width, height, own_player_id, create_renderer(self._renderer, width, height),
+                                self._fill_algo, self._pool, self._metrics)
+        self._metrics.count("games")
+        self._games += 1
+        self._log.info("Got game state!")
+
+    async def _on_pos(self, args: list[bytes], received: float):
+        if self._state is not None:
+            self._pending_pos.append((int(args[0]), int(args[1]), int(args[2])))
+
+    def close(self):
+        if self._state is not None:
+            self._state.close()
+            self._state = None
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        self._metrics.close()
+        if self._profiler is not None:
+            self._profiler.close()
+        if self._recorder is not None:
+            self._recorder.close()
 
     async def chat(self, message: str):
         await self._send("chat", [message])
 
-    async def _send(self, code: str, data: list[str]):
+    def _queue(self, code: str, data: list[str]):
         assert isinstance(code, str)
         assert isinstance(data, list)
         msg = [code]
         msg.extend(data)
-        msg = "|".join(msg) + "\n"
+        msg = "|".join(msg).rstrip("\n") + "\n"
         #print(f"> {msg}")
-        await self._loop.sock_sendall(self._sock, msg.encode('utf8'))
+        self._out += msg.encode('utf8')
+        if self._recorder is not None:
+            self._recorder.sent(code, data)
+
+    async def _flush(self):
+        if not self._out:
+            return
+        self._writer.write(bytes(self._out))
+        self._out.clear()
+        if self._recorder is not None:
+            self._recorder.flush()
+        await self._writer.drain()
+
+    async def _send(self, code: str, data: list[str]):
+        self._queue(code, data)
+        await self._flush()
 
     async def _join(self):
         await self._send("join", [self._username, self._password])
+        self._log.info("join sent %.1fms after start", (time.perf_counter() - _STARTED) * 1000)
+        # load the decision engine (and numpy) and start the worker pool while the server sets up the game
+        import game_state
+        if self._workers > 0 and self._pool is None:
+            from parallel import ParallelEvaluator
+            self._pool = ParallelEvaluator(self._workers)
 
 
 async def manual_event_server(ctx: ConnectionContext):
@@ -106,11 +233,11 @@ async def manual_event_server(ctx: ConnectionContext):
     sock.setblocking(False)
     sock.bind(("127.0.0.1", 4006))
     loop = asyncio.get_event_loop()
-    print("Starting BME")
+    log.info("Starting BME")
     while True:
         try:
             data = (await loop.sock_recv(sock, 1024)).decode('utf8').rstrip("\n")
-            print(data)
+            log.debug(data)
             code = data.split('|')[0]
             args = data.split('|')[:-1]
             if code == "msg":
@@ -119,11 +246,15 @@ async def manual_event_server(ctx: ConnectionContext):
             pass
 
 
-async def connect(dns, port):
-    print("Connecting to %s:%i" % (dns, port))
-    loop = asyncio.get_event_loop()
-    ctx = ConnectionContext(dns, port)
-    loop.create_task(ctx.client_loop())
+async def connect(dns, port, tick_budget=None, renderer="gui", fill_algo="regions", workers=0, metrics=None,
+                  profiler=None, recorder=None):
+    log.info("Connecting to %s:%i", dns, port)
+    ctx = ConnectionContext(dns, port, tick_budget, renderer, fill_algo, workers, metrics, profiler, recorder)
+    await ctx.connect()
+    try:
+        await ctx.client_loop()
+    finally:
+        ctx.close()
 
 
 if __name__ == '__main__':
@@ -132,8 +263,34 @@ if __name__ == '__main__':
         description='What the program does',
         epilog='Text at the bottom of help')
     parser.add_argument('server')  # positional argument
-    parser.add_argument('-p', '--port', default=4000)
+    parser.add_argument('-p', '--port', type=int, default=4000)
+    parser.add_argument('-b', '--budget', type=float, default=200,
+                        help='time budget per tick in ms, measured from receiving the tick line (0 = unbounded)')
+    parser.add_argument('--headless', action='store_true', help='run without a GUI, same as --renderer none')
+    parser.add_argument('--renderer', choices=RENDERERS, default='gui')
+    parser.add_argument('--fill', choices=['regions', 'bfs', 'bitboard'], default='regions',
+                        help='how reachable area is counted: incremental regions, flood fill or bitboards')
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='processes that run the lookahead search in parallel (0 = search in the client loop)')
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='warning')
+    parser.add_argument('--metrics-jsonl', help='append one JSON line of timings per tick to this file')
+    parser.add_argument('--metrics-prom', help='keep Prometheus text metrics in this file (rewritten every 100 ticks)')
+    parser.add_argument('--profile-slow-ms', type=float, default=0,
+                        help='profile every tick and keep profiles of ticks slower than this (0 = off)')
+    parser.add_argument('--profile-dir', default='slow_ticks', help='where --profile-slow-ms writes .prof and .json files')
+    parser.add_argument('--record', help='append every game to this log, replay it with recorder.py')
     args = parser.parse_args()
-    asyncio.run(connect(args.server, args.port))
+    setup_logging(args.log_level)
+    profiler = None
+    if args.profile_slow_ms > 0:
+        from profiler import SlowTickProfiler
+        profiler = SlowTickProfiler(args.profile_slow_ms / 1000, args.profile_dir)
+    recorder = None
+    if args.record:
+        from recorder import Recorder
+        recorder = Recorder(args.record)
+    asyncio.run(connect(args.server, args.port, args.budget / 1000 if args.budget > 0 else None,
+                        'none' if args.headless else args.renderer, args.fill, args.workers,
+                        Metrics(args.metrics_jsonl, args.metrics_prom), profiler, recorder))
 
     # asyncio.run(connect('2001:67c:20a1:232:d681:d7ff:fe8c:5033', 4000))
@@ -0,0 +1,135 @@
+import bisect
+import json
+import logging
+import os
+import time
+from typing import Optional, TextIO
+
+from util import MoveReason
+
+# upper bounds of the latency buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+PROMETHEUS_EVERY = 100  # ticks between rewrites of the Prometheus file
+
+LOG_LEVELS = ["debug", "info", "warning", "error"]
+
+
+def setup_logging(level: str = "warning"):
+    # everything below warning is off unless asked for
+    logging.basicConfig(level=getattr(logging, level.upper()), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        # upper bound of the bucket holding the q-quantile (the maximum for the +Inf bucket)
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            if count and cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    ###
+    # Per-tick timings and decision counters.
+    #   - observe() feeds a latency histogram and the current tick's record, count() a counter
+    #   - end_tick() closes the tick: its record goes out as one JSON line (if a file is set)
+    #     and every PROMETHEUS_EVERY ticks the Prometheus text file is rewritten (if one is set)
+    # Recording is a perf_counter pair, a bisect and a few dict updates, cheap enough to
+    # leave on.
+    def __init__(self, jsonl: Optional[str] = None, prometheus: Optional[str] = None):
+        self.histograms = {}
+        self.counters = {}
+        self._tick = {}
+        self._jsonl: Optional[TextIO] = open(jsonl, "a") if jsonl else None
+        self._prometheus = prometheus
+        self._ticks = 0
+
+    def observe(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+        self._tick[name] = self._tick.get(name, 0.0) + seconds
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def move_reason(self, reason: MoveReason):
+        self.count("move_reason_" + reason.name.lower())
+        self._tick["reason"] = reason.value
+
+    def end_tick(self, tick: int):
+        self._ticks += 1
+        if self._jsonl is not None:
+            record = {"tick": tick}
+            for name, value in self._tick.items():
+                if isinstance(value, float):
+                    record[name + "_ms"] = round(value * 1000, 3)
+                else:
+                    record[name] = value
+            self._jsonl.write(json.dumps(record) + "\n")
+        self._tick = {}
+        if self._prometheus is not None and self._ticks % PROMETHEUS_EVERY == 0:
+            self.write_prometheus()
+
+    def prometheus_text(self) -> str:
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            lines.append("# TYPE bot_%s_total counter" % name)
+            lines.append("bot_%s_total %i" % (name, value))
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append("# TYPE bot_%s_seconds histogram" % name)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append('bot_%s_seconds_bucket{le="%s"} %i' % (name, le, cumulative))
+            lines.append("bot_%s_seconds_sum %f" % (name, histogram.sum))
+            lines.append("bot_%s_seconds_count %i" % (name, histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        # written next to the target and renamed, so a scraper never reads half a file
+        tmp = self._prometheus + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, self._prometheus)
+
+    def close(self):
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+        if self._prometheus is not None:
+            self.write_prometheus()
+
+
+class Timer:
+    # with Timer(metrics, "name"): ... observes the time spent in the block
+    __slots__ = ("_metrics", "_name", "_start")
+
+    def __init__(self, metrics: Metrics, name: str):
+        self._metrics = metrics
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe(self._name, time.perf_counter() - self._start)
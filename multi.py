@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from array import array
+
+from main import ConnectionContext
+from metrics import LOG_LEVELS, Metrics, setup_logging
+
+log = logging.getLogger(__name__)
+
+###
+# Many bot sessions in one process, all on one event loop.
+#   - one ConnectionContext per account, headless, each with its own socket and Metrics
+#   - the per board size tables (neighbour tables, flood fill buffers, Zobrist keys, endgame
+#     colouring, bitboard masks) are cached per process, so every session playing on a board
+#     of the same size uses the same ones
+#   - connects are staggered through a semaphore so a few hundred sessions don't all hit the
+#     server at once
+#   - the report shows tick latency per session, measured like main.py does (from receiving
+#     the tick line to the move being written), plus the CPU share of the whole process; its
+#     percentiles come from every tick's latency, not from the histogram buckets
+#   - a session that fails is logged and reported as failed, the others keep playing
+#
+#   python multi.py sessions.json
+# sessions.json:
+#   {"server": "127.0.0.1", "port": 4000, "budget_ms": 200, "fill": "regions",
+#    "sessions": [{"username": "bot1", "password": "..."}, {"username": "bot2", "password": "..."}]}
+
+CONNECT_CONCURRENCY = 8
+
+
+class SessionMetrics(Metrics):
+    # Metrics that also keep every tick's latency, for exact percentiles in the report
+    def __init__(self):
+        super().__init__()
+        self.ticks = array('d')
+
+    def observe(self, name: str, seconds: float):
+        super().observe(name, seconds)
+        if name == "tick":
+            self.ticks.append(seconds)
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    # nearest rank
+    return ordered[max(0, min(len(ordered) - 1, int(q * len(ordered) + 0.5) - 1))]
+
+
+class Session:
+    def __init__(self, username: str, ctx: ConnectionContext, metrics: SessionMetrics):
+        self.username = username
+        self.ctx = ctx
+        self.metrics = metrics
+        self.error = None
+
+
+def load_sessions(config: dict) -> list[Session]:
+    budget_ms = config.get("budget_ms", 200)
+    sessions = []
+    for entry in config["sessions"]:
+        metrics = SessionMetrics()
+        ctx = ConnectionContext(config.get("server", "127.0.0.1"), config.get("port", 4000),
+                                budget_ms / 1000 if budget_ms > 0 else None, "none",
+                                config.get("fill", "regions"), metrics=metrics,
+                                username=entry["username"], password=entry.get("password", ""))
+        sessions.append(Session(entry["username"], ctx, metrics))
+    return sessions
+
+
+async def run_session(session: Session, connect_slots: asyncio.Semaphore):
+    try:
+        async with connect_slots:
+            await session.ctx.connect()
+        await session.ctx.client_loop()
+    except (OSError, asyncio.IncompleteReadError) as e:
+        session.error = e
+        log.error("%s: %s", session.username, e)
+    except Exception as e:
+        # a bug in one session must not cancel the others through gather()
+        session.error = e
+        log.exception("%s: session failed", session.username)
+    finally:
+        session.ctx.close()
+
+
+def report(sessions: list[Session], wall: float, cpu: float) -> str:
+    lines = ["%-16s %7s %5s %9s %9s %9s %9s" % ("session", "ticks", "late", "mean ms", "p50 ms", "p99 ms", "max ms")]
+    ticks = 0
+    for session in sessions:
+        histogram = session.metrics.histograms.get("tick")
+        late = session.metrics.counters.get("late_ticks", 0)
+        if histogram is None or not histogram.count:
+            lines.append("%-16s %7i %5i %s" % (session.username, 0, late,
+                                               "failed: %s" % session.error if session.error else "-"))
+            continue
+        ticks += histogram.count
+        ordered = sorted(session.metrics.ticks)
+        lines.append("%-16s %7i %5i %9.2f %9.2f %9.2f %9.2f" % (
+            session.username, histogram.count, late, histogram.sum / histogram.count * 1000,
+            _percentile(ordered, 0.5) * 1000, _percentile(ordered, 0.99) * 1000, histogram.max * 1000))
+    lines.append("%i sessions, %i ticks in %.1fs, %.0f%% of one core" % (
+        len(sessions), ticks, wall, 100 * cpu / wall if wall > 0 else 0))
+    return "\n".join(lines)
+
+
+async def report_loop(sessions: list[Session], every: float, started: float, cpu_started: float):
+    while True:
+        await asyncio.sleep(every)
+        log.warning("\n%s", report(sessions, time.perf_counter() - started, time.process_time() - cpu_started))
+
+
+async def run(sessions: list[Session], connect_concurrency: int = CONNECT_CONCURRENCY, report_every: float = 0):
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    reporter = None
+    if report_every > 0:
+        reporter = asyncio.create_task(report_loop(sessions, report_every, started, cpu_started))
+    connect_slots = asyncio.Semaphore(connect_concurrency)
+    try:
+        await asyncio.gather(*(run_session(session, connect_slots) for session in sessions))
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+    return time.perf_counter() - started, time.process_time() - cpu_started
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run many bot sessions in one process')
+    parser.add_argument('config', help='JSON file with server, port, budget_ms, fill and a list of sessions')
+    parser.add_argument('--connect-concurrency', type=int, default=CONNECT_CONCURRENCY,
+                        help='sessions connecting at the same time')
+    parser.add_argument('--report-every', type=float, default=0,
+                        help='log the latency report every this many seconds (0 = only at the end)')
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='warning')
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    with open(args.config) as f:
+        sessions = load_sessions(json.load(f))
+    wall, cpu = asyncio.run(run(sessions, args.connect_concurrency, args.report_every))
+    print(report(sessions, wall, cpu))
@@ -0,0 +1,160 @@
+import time
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+
+from board import Board
+from search import LookaheadSearch, SearchResult
+from util import Deadline
+
+WORKER_MARGIN = 0.003  # seconds workers stop before the deadline, so their results make it back in time
+
+
+class _Worker:
+    # per-process state of a pool worker: the attached segment, and a board and search per game
+    def __init__(self, name: str):
+        self.name = name
+        self.shared = _open_segment(name)
+        self.game = None
+        self.size = 0
+        self.board = None
+        self.search = None
+
+    def start_game(self, game: int, width: int, height: int):
+        self.game = game
+        self.size = 2 * width * height
+        self.board = Board(width, height)
+        self.search = LookaheadSearch(self.board)
+
+
+_worker: Optional[_Worker] = None
+
+
+def _open_segment(name: str) -> shared_memory.SharedMemory:
+    # attaching would register the segment with the resource tracker the workers share with the
+    # parent, as if they owned it too; the parent creates and unlinks it
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name)
+    finally:
+        resource_tracker.register = register
+
+
+def _warm_up() -> bool:
+    return True
+
+
+def _attach(name: str, game: int, width: int, height: int) -> _Worker:
+    # the segment changes when it had to grow, the game on every game message
+    global _worker
+    if _worker is None or _worker.name != name:
+        if _worker is not None:
+            _worker.shared.close()
+        _worker = _Worker(name)
+    if _worker.game != game:
+        _worker.start_game(game, width, height)
+    return _worker
+
+
+def _search_move(name: str, game: int, width: int, height: int, own_pid: int, heads: dict[int, int],
+                 opponents: list[int], move: int, key: int, at: Optional[float]) -> Optional[list[float]]:
+    # search one of our root moves on a private copy of the shared board, values per completed round
+    now = time.perf_counter()
+    if at is not None and now >= at - WORKER_MARGIN:
+        return None  # picked up too late, nobody waits for this any more
+    worker = _attach(name, game, width, height)
+    cells = array('H')
+    cells.frombytes(worker.shared.buf[:worker.size])
+    worker.board.cells = cells
+    worker.search.key = key
+    deadline = Deadline(now, None if at is None else at - WORKER_MARGIN - now, margin=0.0)
+    worker.search.search(own_pid, heads, opponents, deadline, root_moves=[move])
+    return worker.search.values
+
+
+class PendingSearch:
+    # the workers' searches of one tick; result() collects whatever finished in time
+    def __init__(self, futures: dict[Future, int]):
+        self._futures = futures
+
+    def result(self, deadline: Deadline) -> Optional[SearchResult]:
+        # the best of our moves, compared at the deepest round every answering worker completed
+        timeout = deadline.work_left()
+        done, pending = wait(self._futures, timeout=None if timeout is None else max(0.0, timeout))
+        for future in pending:
+            future.cancel()
+        values = {}
+        for future in done:
+            if not future.cancelled() and future.exception() is None and future.result():
+                values[self._futures[future]] = future.result()
+        if not values:
+            return None
+        depth = min(len(v) for v in values.values())
+        move = max(values, key=lambda m: values[m][depth - 1])
+        return SearchResult(move, values[move][depth - 1], depth)
+
+    def cancel(self):
+        for future in self._futures:
+            future.cancel()
+
+
+class ParallelEvaluator:
+    ###
+    # Splits the lookahead search by our first move across a process pool.
+    #   - one pool and one shared memory segment per connection, kept across games: a game
+    #     message only zeroes the segment, and replaces it if the board is larger than any before
+    #   - the board lives in the segment: GameState's Board uses it as its cell array, so
+    #     pos/die events update it in place and nothing is pickled per tick except the heads
+    #   - every worker copies the cells into its own array before searching, since the search
+    #     applies moves to the board it works on
+    #   - submit() returns at once, the workers search while get_move scores the moves in this
+    #     process; results are collected at the deadline, late workers are ignored, and a task a
+    #     worker only picks up after the deadline returns at once
+    def __init__(self, workers: int):
+        self._shared: Optional[shared_memory.SharedMemory] = None
+        self.cells: Optional[memoryview] = None
+        self._game = 0
+        self._width = 0
+        self._height = 0
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        # start the workers now instead of on the first tick that needs them
+        for _ in range(workers):
+            self._executor.submit(_warm_up)
+
+    def start_game(self, width: int, height: int) -> memoryview:
+        # zeroed cells for a new game; every view on the previous game's cells must be gone
+        size = 2 * width * height
+        if self.cells is not None:
+            self.cells.release()
+            self.cells = None
+        if self._shared is None or self._shared.size < size:
+            self._release_segment()
+            self._shared = shared_memory.SharedMemory(create=True, size=size)
+        self._shared.buf[:size] = bytes(size)
+        self.cells = self._shared.buf[:size].cast('H')
+        self._game += 1
+        self._width = width
+        self._height = height
+        return self.cells
+
+    def submit(self, own_pid: int, heads: dict[int, int], opponents: list[int], moves: list[int],
+               key: int, deadline: Deadline) -> PendingSearch:
+        futures = {self._executor.submit(_search_move, self._shared.name, self._game, self._width, self._height,
+                                         own_pid, heads, opponents, move, key, deadline.stop_at): move
+                   for move in moves}
+        return PendingSearch(futures)
+
+    def _release_segment(self):
+        if self._shared is not None:
+            self._shared.close()
+            self._shared.unlink()
+            self._shared = None
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.cells is not None:
+            self.cells.release()
+            self.cells = None
+        self._release_segment()
@@ -0,0 +1,66 @@
+import cProfile
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+log = logging.getLogger(__name__)
+
+
+class SlowTickProfiler:
+    ###
+    # cProfile capture of whole ticks, kept only for the slow ones.
+    #   - start() is called for every incoming message and begins a capture unless one is
+    #     running, so a capture covers everything from the first message after the last
+    #     move (pos, die, ...) up to the next move being sent
+    #   - finish() ends it; if the tick took at least the threshold, the profile is written
+    #     as <name>.prof (pstats format: python -m pstats, snakeviz, ...) next to a JSON
+    #     snapshot of the board, <name>.json; otherwise it is thrown away
+    #   - files are written by a background thread, so the event loop only pays for taking
+    #     the snapshot; close() waits for the pending writes
+    def __init__(self, threshold: float, directory: str):
+        # threshold in seconds, measured from receiving the tick line to the move being sent
+        self._threshold = threshold
+        self._directory = directory
+        self._profile: Optional[cProfile.Profile] = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiler")
+        self.captured = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def finish(self, game: int, tick: int, elapsed: float, snapshot: Callable[[], dict]) -> Optional[str]:
+        # snapshot is only called for slow ticks; returns the path the capture was written to
+        # (without extension), None if it was dropped
+        profile = self._profile
+        self._profile = None
+        if profile is None:
+            return None
+        profile.disable()
+        if elapsed < self._threshold:
+            return None
+        path = os.path.join(self._directory, "game%i-tick%06i-%ims" % (game, tick, elapsed * 1000))
+        record = {"game": game, "tick": tick, "elapsed_ms": round(elapsed * 1000, 3), "board": snapshot()}
+        self._writer.submit(self._write, profile, path, record)
+        self.captured += 1
+        log.warning("tick %i took %.1fms, writing profile to %s.prof", tick, elapsed * 1000, path)
+        return path
+
+    @staticmethod
+    def _write(profile: cProfile.Profile, path: str, record: dict):
+        try:
+            profile.dump_stats(path + ".prof")
+            with open(path + ".json", "w") as f:
+                json.dump(record, f)
+        except OSError as e:
+            log.error("could not write profile %s: %s", path, e)
+
+    def close(self):
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile = None
+        self._writer.shutdown(wait=True)
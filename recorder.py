@@ -0,0 +1,277 @@
+import argparse
+import mmap
+import os
+import random
+import statistics
+import struct
+import time
+from array import array
+from typing import Iterator, Optional
+
+from util import Deadline, Direction
+
+###
+# Game logs: every received game/pos/tick/die/lose line and every sent move/chat, as
+# fixed-size 16 byte records appended to <path>, plus <path>.idx with one entry per tick.
+#
+#   record  <BxHiii  kind, a, b, c, d
+#     GAME   b, c, d = width, height, own player id
+#     POS    b, c, d = player id, x, y
+#     TICK   b, c = tick number within the game, ms since the game message
+#     DIE    b = player id (one record per player)
+#     LOSE
+#     MOVE   a = direction (index into Direction), b = tick number, c = us since the tick was received,
+#            d = flags (BOXED_IN: get_move left the state boxed in)
+#     CHAT   a = length in bytes, followed by ceil(a / 12) CHUNK records
+#   chunk   <BxH12s  kind, a = bytes used, 12 bytes of the chat message
+#   index   <II      record number of the tick, record number of its game's GAME record
+#
+#   python main.py server --record games.log
+#   python recorder.py games.log                 # re-run get_move on every recorded tick
+#   python recorder.py games.log --from 120 --to 130
+#
+# Replaying from the middle of a game restores what get_move carries between ticks from the
+# records before: its tick count, direction, boxed-in flag and when it last chatted. Ties that
+# get_move breaks at random (every 5th tick) are not reproduced.
+
+RECORD = struct.Struct('<BxHiii')
+CHUNK = struct.Struct('<BxH12s')
+INDEX = struct.Struct('<II')
+
+GAME, POS, TICK, DIE, LOSE, MOVE, CHAT, CHUNK_DATA = range(1, 9)
+BOXED_IN = 1
+
+_DIRECTIONS = list(Direction)
+_DIRECTION_INDEX = {d.value: i for i, d in enumerate(_DIRECTIONS)}
+
+
+class Recorder:
+    def __init__(self, path: str):
+        self._log = open(path, "ab")
+        self._index = open(path + ".idx", "ab")
+        self._records = self._log.tell() // RECORD.size
+        self._game_record = 0
+        self._game_start = 0.0
+        self._tick = 0
+        self._tick_received = 0.0
+        self._flags = 0
+
+    def received(self, code: bytes, args: list[bytes], received: float):
+        if code == b"pos":
+            self._write(POS, 0, int(args[0]), int(args[1]), int(args[2]))
+        elif code == b"tick":
+            self._tick += 1
+            self._tick_received = received
+            self._index.write(INDEX.pack(self._records, self._game_record))
+            self._write(TICK, 0, self._tick, int((received - self._game_start) * 1000), 0)
+        elif code == b"die":
+            for pid in args:
+                self._write(DIE, 0, int(pid), 0, 0)
+        elif code == b"game":
+            self._game_record = self._records
+            self._game_start = received
+            self._tick = 0
+            self._write(GAME, 0, int(args[0]), int(args[1]), int(args[2]))
+        elif code == b"lose":
+            self._write(LOSE, 0, 0, 0, 0)
+
+    def decided(self, boxed_in: bool):
+        # state after get_move, stored with the move that is sent next
+        self._flags = BOXED_IN if boxed_in else 0
+
+    def sent(self, code: str, data: list[str]):
+        if code == "move":
+            latency = int((time.perf_counter() - self._tick_received) * 1e6)
+            self._write(MOVE, _DIRECTION_INDEX[data[0]], self._tick, latency, self._flags)
+            self._flags = 0
+        elif code == "chat":
+            text = data[0].rstrip("\n").encode("utf8")[:0xFFFF]
+            self._write(CHAT, len(text), 0, 0, 0)
+            for start in range(0, len(text), 12):
+                part = text[start:start + 12]
+                self._log.write(CHUNK.pack(CHUNK_DATA, len(part), part))
+                self._records += 1
+
+    def flush(self):
+        self._log.flush()
+        self._index.flush()
+
+    def close(self):
+        self._log.close()
+        self._index.close()
+
+    def _write(self, kind: int, a: int, b: int, c: int, d: int):
+        self._log.write(RECORD.pack(kind, a, b, c, d))
+        self._records += 1
+
+
+class Replay:
+    ###
+    # Reads a game log through mmap. Tick k is the k-th tick of the whole log (0-based);
+    # the index gives its record and the GAME record it belongs to, so any tick can be
+    # rebuilt by applying just the records of its game, the same way ConnectionContext
+    # applies the lines.
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._records = size // RECORD.size
+        index = array('I')
+        with open(path + ".idx", "rb") as f:
+            index.frombytes(f.read())
+        # entries of a partly written last tick are dropped
+        self._index = [(index[i], index[i + 1]) for i in range(0, len(index) - 1, 2)
+                       if index[i] < self._records]
+
+    @property
+    def ticks(self) -> int:
+        return len(self._index)
+
+    def record(self, number: int) -> tuple[int, int, int, int, int]:
+        return RECORD.unpack_from(self._map, number * RECORD.size)
+
+    def records(self, start: int = 0, end: Optional[int] = None) -> Iterator[tuple[int, int, int, int, int]]:
+        end = self._records if end is None else min(end, self._records)
+        view = memoryview(self._map)[start * RECORD.size:end * RECORD.size]
+        try:
+            yield from RECORD.iter_unpack(view)
+        finally:
+            view.release()
+
+    def chat(self, number: int) -> str:
+        # text of the CHAT record with this number
+        length = self.record(number)[1]
+        parts = []
+        for i in range((length + 11) // 12):
+            _, used, data = CHUNK.unpack_from(self._map, (number + 1 + i) * RECORD.size)
+            parts.append(data[:used])
+        return b"".join(parts).decode("utf8", "replace")
+
+    def recorded_move(self, tick: int) -> Optional[Direction]:
+        # the move we sent for this tick, if any
+        start = self._index[tick][0]
+        end = self._index[tick + 1][0] if tick + 1 < len(self._index) else self._records
+        for kind, a, b, c, d in self.records(start + 1, end):
+            if kind == MOVE:
+                return _DIRECTIONS[a]
+            if kind in (GAME, TICK):
+                break
+        return None
+
+    def state_at(self, tick: int, fill_algo: str = "regions"):
+        # GameState as get_move saw it on this tick
+        tick_record, game_record = self._index[tick]
+        for state, number in self._replay(game_record, tick_record + 1, fill_algo):
+            if number == tick_record:
+                return state
+
+    def run(self, start: int = 0, end: Optional[int] = None, fill_algo: str = "regions",
+            budget: Optional[float] = None, seed: int = 0) -> dict:
+        # re-runs get_move on ticks [start, end) and compares with the moves that were sent
+        end = self.ticks if end is None else min(end, self.ticks)
+        result = {"ticks": 0, "matching": 0, "mismatches": [], "get_move_ms": [], "recorded_ms": 0.0}
+        if start >= end:
+            return result
+        random.seed(seed)
+        tick_of = {self._index[k][0]: k for k in range(start, end)}
+        last_record = self._index[end][0] if end < self.ticks else self._records
+        previous = None  # (game record, ms since the game message) of the last replayed tick
+        state = None
+        for state, number in self._replay(self._index[start][1], last_record, fill_algo):
+            tick = tick_of.get(number)
+            if tick is None:
+                continue  # before the first tick asked for
+            game_record = self._index[tick][1]
+            elapsed_ms = self.record(number)[3]
+            if previous is not None and previous[0] == game_record:
+                result["recorded_ms"] += elapsed_ms - previous[1]
+            previous = (game_record, elapsed_ms)
+            started = time.perf_counter()
+            direc, _ = state.get_move(tick, Deadline(started, budget))
+            result["get_move_ms"].append((time.perf_counter() - started) * 1000)
+            result["ticks"] += 1
+            recorded = self.recorded_move(tick)
+            if direc == recorded:
+                result["matching"] += 1
+            else:
+                result["mismatches"].append((tick, recorded, direc))
+        if state is not None:
+            state.close()
+        return result
+
+    def _replay(self, start: int, end: int, fill_algo: str):
+        # applies records [start, end) the way ConnectionContext applies the lines and yields
+        # (state, record number) on every tick record, with the state get_move sees there;
+        # what get_move itself would have kept is taken from the MOVE and CHAT records
+        from game_state import GameState, _random_messages
+        random_messages = {m.rstrip("\n") for m in _random_messages()}
+        state = None
+        pending = []
+        moves = 0  # get_move calls that sent a move, its own tick count
+        direction = Direction.UP
+        boxed_in = False
+        last_message_tick = 0
+        for number, (kind, a, b, c, d) in enumerate(self.records(start, end), start):
+            if kind != POS and pending:
+                state.update_player_positions(pending)
+                pending = []
+            if kind == GAME:
+                if state is not None:
+                    state.close()
+                state = GameState(b, c, d, fill_algo=fill_algo)
+                moves = last_message_tick = 0
+                direction = Direction.UP
+                boxed_in = False
+            elif kind == POS:
+                pending.append((b, c, d))
+            elif kind == DIE:
+                boxed_in = False
+                state.boxed_in = False
+                state.remove_player(b)
+            elif kind == LOSE:
+                state.remove_self()
+            elif kind == MOVE:
+                moves += 1
+                direction = _DIRECTIONS[a]
+                boxed_in = bool(d & BOXED_IN)
+            elif kind == CHAT:
+                if self.chat(number) in random_messages:
+                    last_message_tick = moves + 1  # sent before the move of the same tick
+            elif kind == TICK:
+                state.restore(moves, direction, boxed_in, last_message_tick)
+                yield state, number
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-run get_move on a recorded game log')
+    parser.add_argument('log')
+    parser.add_argument('--from', dest='start', type=int, default=0, help='first tick (index over the whole log)')
+    parser.add_argument('--to', dest='end', type=int, help='stop before this tick')
+    parser.add_argument('--fill-algo', choices=['regions', 'bfs', 'bitboard'], default='regions')
+    parser.add_argument('--budget', type=float, default=0, help='tick budget in ms passed to get_move (0 = unbounded)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    replay = Replay(args.log)
+    started = time.perf_counter()
+    result = replay.run(args.start, args.end, args.fill_algo, args.budget / 1000 if args.budget > 0 else None,
+                        args.seed)
+    took = (time.perf_counter() - started) * 1000
+    replay.close()
+    timings = result["get_move_ms"]
+    print("%i ticks replayed in %.1fms (recorded: %.1fms), %i of them with the recorded move" % (
+        result["ticks"], took, result["recorded_ms"], result["matching"]))
+    if timings:
+        ordered = sorted(timings)
+        print("get_move p50 %.3fms p99 %.3fms max %.3fms" % (
+            statistics.median(ordered), ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], ordered[-1]))
+    for tick, recorded, replayed in result["mismatches"]:
+        print("tick %i: sent %s, now %s" % (tick, recorded.name if recorded else None,
+                                              replayed.name if replayed else None))
+    if result["mismatches"]:
+        print("note: ties get_move breaks at random (every 5th tick) are not reproduced")
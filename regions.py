@@ -0,0 +1,161 @@
+from array import array
+from typing import Hashable, Iterable, Optional
+
+from board import Board
+from util import Deadline, Direction
+
+
+def may_split(board: Board, idx: int) -> bool:
+    # Local cut test for taking cell idx: False means the free cells around it stay connected
+    # through its 8-neighbourhood, True means they might fall apart.
+    if board.width < 3 or board.height < 3:
+        return True
+    steps = board.steps
+    up = steps[Direction.UP]
+    down = steps[Direction.DOWN]
+    left = steps[Direction.LEFT]
+    right = steps[Direction.RIGHT]
+    north = up[idx]
+    east = right[idx]
+    south = down[idx]
+    west = left[idx]
+    # 8-neighbourhood in ring order, orthogonal neighbours on even positions
+    ring = (north, right[north], east, down[east], south, left[south], west, up[west])
+    free = [board.is_free(n) for n in ring]
+    if sum(free[0::2]) <= 1:
+        return False
+    if all(free):
+        return False
+    # walk the ring starting on a blocked cell and count free arcs touching an orthogonal neighbour
+    start = free.index(False)
+    arcs = 0
+    in_arc = False
+    touches = False
+    for i in range(1, 9):
+        pos = (start + i) % 8
+        if free[pos]:
+            in_arc = True
+            touches = touches or pos % 2 == 0
+        elif in_arc:
+            arcs += touches
+            in_arc = touches = False
+    return arcs > 1
+
+
+class RegionIndex:
+    ###
+    # Connected regions of free cells, kept up to date from pos/die events.
+    #   - every free cell carries a region label, labels are merged with union-find
+    #   - blocking a cell only decrements the region size; if the 8 cells around it say the
+    #     region might have been cut, the region is marked dirty
+    #   - freeing a cell unions it with its free neighbours
+    #   - dirty regions are split lazily: a lookup relabels just the component it lands in
+    # Works on Board indices and its precomputed neighbour table.
+    def __init__(self, width: int, height: int):
+        self._width = width
+        self._height = height
+        self._label = array('I', bytes(4 * width * height))
+        self._parent = [0]
+        self._size = [width * height]
+        self._dirty = [False]
+        self._stack = []
+
+    def block(self, board: Board, idx: int):
+        root = self._find(self._label[idx])
+        self._size[root] -= 1
+        if not self._dirty[root] and may_split(board, idx):
+            self._dirty[root] = True
+
+    def free(self, board: Board, idx: int):
+        root = self._new_region(1, False)
+        self._label[idx] = root
+        for n in board.adjacency[idx]:
+            if board.is_free(n):
+                root = self._union(root, self._find(self._label[n]))
+
+    def region_at(self, board: Board, idx: int) -> Optional[int]:
+        if not board.is_free(idx):
+            return None
+        root = self._find(self._label[idx])
+        if self._dirty[root]:
+            root = self._split(board, idx, root)
+        return root
+
+    def size(self, root: int) -> int:
+        return self._size[root]
+
+    def query(self, board: Board, idx: int, player_positions: dict[int, list[int]]) -> tuple[int, int]:
+        return self.query_many(board, [(None, idx)], player_positions)[None]
+
+    def query_many(self, board: Board, starts: Iterable[tuple[Hashable, int]],
+                   player_positions: dict[int, list[int]],
+                   deadline: Optional[Deadline] = None) -> dict[Hashable, tuple[int, int]]:
+        # Same (num_fields, player_count) contract as FieldCountAlgo.flood_fill_count:
+        # player_count is the number of heads bordering the region. Starts not reached
+        # before the deadline are left out.
+        results = {}
+        heads_by_region = None
+        for key, idx in starts:
+            if deadline is not None and deadline.expired():
+                break
+            root = self.region_at(board, idx)
+            if root is None:
+                results[key] = (0, 0)
+                continue
+            if heads_by_region is None:
+                heads_by_region = self._heads_by_region(board, player_positions)
+            results[key] = (self._size[root], heads_by_region.get(root, 0))
+        return results
+
+    def _heads_by_region(self, board: Board, player_positions: dict[int, list[int]]) -> dict[int, int]:
+        counts = {}
+        for pos in player_positions.values():
+            roots = {self.region_at(board, n) for n in board.adjacency[board.index(pos[0], pos[1])]}
+            roots.discard(None)
+            for root in roots:
+                counts[root] = counts.get(root, 0) + 1
+        return counts
+
+    def _split(self, board: Board, start: int, old_root: int) -> int:
+        cells = board.cells
+        adjacency = board.adjacency
+        label = self._label
+        root = self._new_region(0, False)
+        stack = self._stack
+        label[start] = root
+        stack.append(start)
+        count = 0
+        while stack:
+            idx = stack.pop()
+            count += 1
+            for n in adjacency[idx]:
+                if label[n] != root and not cells[n]:
+                    label[n] = root
+                    stack.append(n)
+        self._size[root] = count
+        self._size[old_root] -= count
+        return root
+
+    def _new_region(self, size: int, dirty: bool) -> int:
+        root = len(self._parent)
+        self._parent.append(root)
+        self._size.append(size)
+        self._dirty.append(dirty)
+        return root
+
+    def _find(self, root: int) -> int:
+        parent = self._parent
+        while parent[root] != root:
+            parent[root] = parent[parent[root]]
+            root = parent[root]
+        return root
+
+    def _union(self, a: int, b: int) -> int:
+        if a == b:
+            return a
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+        self._dirty[a] = self._dirty[a] or self._dirty[b]
+        return a
@@ -0,0 +1,37 @@
+from typing import Optional
+
+from util import Direction
+
+
+class Renderer:
+    ###
+    # What GameState reports to a visualizer. The base class draws nothing, which is what
+    # headless runs use; GUIProcess in ui.py is the Tk implementation.
+    def wm_title(self, title: str):
+        pass
+
+    def add_cell(self, x: int, y: int, pid: int):
+        pass
+
+    def remove_player(self, pid: int):
+        pass
+
+    def update_game(self, player_heads: dict[int, list[int]], own_pid: int, could_collide: set[Direction],
+                    move_dir: Direction, reason: Optional[tuple[int, int, str]]):
+        pass
+
+    def close(self):
+        pass
+
+
+RENDERERS = ["gui", "none"]
+
+
+def create_renderer(kind: str, width: int, height: int) -> Renderer:
+    if kind == "none":
+        return Renderer()
+    if kind == "gui":
+        # tkinter is only imported when a window is actually wanted
+        from ui import GUIProcess
+        return GUIProcess(width, height)
+    raise ValueError("Unknown renderer %s" % kind)
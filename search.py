@@ -0,0 +1,261 @@
+import random
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from board import Board, FREE
+from flood_fill import FloodFill
+from util import Deadline
+
+LOSS = -1.0
+MAX_DEPTH = 8  # rounds, when a deadline bounds the search
+UNBOUNDED_DEPTH = 1  # rounds, when it does not
+TABLE_SIZE = 1 << 16
+ITERATION_GROWTH = 4.0  # assumed cost ratio of one more round when only one iteration was timed
+LEAF_FILL_LIMIT = 4096  # free cells a leaf counts at most, larger regions all score as this many
+LEAF_CELL_COST = 1e-6  # seconds per counted cell, the leaf estimate until one has been measured
+
+EXACT, LOWER, UPPER = range(3)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchResult(NamedTuple):
+    move: int  # cell our head moves to
+    value: float
+    depth: int  # rounds of the deepest completed iteration
+
+
+@lru_cache(maxsize=8)
+def _zobrist(width: int, height: int) -> tuple[list[int], list[int], list[int]]:
+    # random keys per cell: taken, our head there, an opponent's head there
+    rng = random.Random(width * 65536 + height)
+    size = width * height
+    return tuple([rng.getrandbits(64) for _ in range(size)] for _ in range(3))
+
+
+class LookaheadSearch:
+    ###
+    # Paranoid alpha-beta search over our move and the replies of the nearest opponents.
+    #   - one round is our move followed by one move of every searched opponent; the moves
+    #     happen at once, so heads meeting on the same cell all die (as on the server)
+    #   - opponents move to minimise our score, players that are not searched stand still
+    #   - leaves are scored like get_move scores a move: free cells reachable from our best
+    #     neighbour divided by 1 + the heads bordering that region, counting at most
+    #     LEAF_FILL_LIMIT cells so a leaf stays cheap on large open boards
+    #   - iterative deepening, one more round per iteration; an iteration is only started if
+    #     its estimated cost (the last one's times the growth between the last two) fits before
+    #     the deadline, and nodes stop early enough that one more leaf evaluation still fits
+    #     (the slowest leaf of the previous search, so the first node of a search is checked too)
+    #   - transposition table keyed by Zobrist hashes of the occupied cells and the heads,
+    #     LRU-evicted; the occupancy part is kept up to date from pos/die via block/free
+    #   - moves are ordered by the table's best move, then by the principal variation of the
+    #     previous iteration (or of the previous tick, shifted by the move we made)
+    # Moves are applied to the board itself and undone before returning.
+    def __init__(self, board: Board, table_size: int = TABLE_SIZE):
+        self._board = board
+        self._cell_keys, self._own_keys, self._opp_keys = _zobrist(board.width, board.height)
+        self._flood_fill = FloodFill(board.width, board.height)
+        self._table = OrderedDict()
+        self._table_size = table_size
+        self._pv = []  # our moves along the principal variation of the last search
+        self.key = 0
+        self.nodes = 0
+        self.values = []
+        # seconds of the slowest leaf evaluation in the last search, and in the current one
+        self._leaf_cost = min(board.width * board.height, LEAF_FILL_LIMIT) * LEAF_CELL_COST
+        self._slowest_leaf = 0.0
+
+    def block(self, idx: int):
+        self.key ^= self._cell_keys[idx]
+
+    def free(self, idx: int):
+        self.key ^= self._cell_keys[idx]
+
+    def search(self, own_pid: int, heads: dict[int, int], opponents: list[int],
+               deadline: Optional[Deadline] = None, root_moves: Optional[list[int]] = None) -> Optional[SearchResult]:
+        # heads maps every living player to the cell of its head, opponents are the ones to search;
+        # root_moves limits our first move (to split the root between workers)
+        own = heads[own_pid]
+        if self._pv and self._pv[0] == own:
+            self._pv = self._pv[1:]
+        else:
+            self._pv = []
+        self._own_pid = own_pid
+        self._heads = dict(heads)
+        self._head_set = set(heads.values())
+        self._head_key = 0
+        for pid, idx in heads.items():
+            self._head_key ^= self._own_keys[idx] if pid == own_pid else self._opp_keys[idx]
+        self._opponents = opponents
+        self._root_moves = root_moves
+        self.values = []  # value of every completed iteration
+        unbounded = deadline is None or deadline.at is None
+        self._stop_at = None if unbounded else deadline.stop_at
+        self._slowest_leaf = 0.0
+        try:
+            return self._deepen(unbounded)
+        finally:
+            if self._slowest_leaf:
+                self._leaf_cost = self._slowest_leaf
+
+    def _deepen(self, unbounded: bool) -> Optional[SearchResult]:
+        result = None
+        costs = []
+        for depth in range(1, (UNBOUNDED_DEPTH if unbounded else MAX_DEPTH) + 1):
+            started = time.perf_counter()
+            if costs and self._stop_at is not None:
+                growth = costs[-1] / costs[-2] if len(costs) > 1 and costs[-2] > 0 else ITERATION_GROWTH
+                if started + costs[-1] * max(1.0, growth) >= self._stop_at:
+                    break  # the next round would not finish in time
+            try:
+                value, line = self._max_value(depth, 0, float("-inf"), float("inf"))
+            except SearchTimeout:
+                break
+            costs.append(time.perf_counter() - started)
+            if not line:
+                break  # no move left
+            self._pv = line
+            self.values.append(value)
+            result = SearchResult(line[0], value, depth)
+            if value == LOSS:
+                break  # every line loses, deeper rounds will not change that
+        return result
+
+    def _store(self, key: int, entry: tuple):
+        table = self._table
+        table[key] = entry
+        table.move_to_end(key)
+        if len(table) > self._table_size:
+            table.popitem(last=False)
+
+    def _max_value(self, depth: int, ply: int, alpha: float, beta: float) -> tuple[float, list[int]]:
+        self.nodes += 1
+        if self._stop_at is not None and time.perf_counter() + self._leaf_cost >= self._stop_at:
+            raise SearchTimeout()
+        # a root limited to some moves is not the position the table knows
+        limited = ply == 0 and self._root_moves is not None
+        key = self.key ^ self._head_key
+        entry = None if limited else self._table.get(key)
+        tt_move = None
+        if entry is not None:
+            self._table.move_to_end(key)
+            e_depth, e_value, e_flag, tt_move, e_line = entry
+            if e_depth >= depth and (e_flag == EXACT or (e_flag == LOWER and e_value >= beta)
+                                     or (e_flag == UPPER and e_value <= alpha)):
+                return e_value, e_line
+        if depth == 0:
+            value = self._evaluate()
+            self._store(key, (0, value, EXACT, None, []))
+            return value, []
+        cells = self._board.cells
+        moves = [n for n in self._board.adjacency[self._heads[self._own_pid]] if not cells[n]]
+        if limited:
+            moves = [n for n in moves if n in self._root_moves]
+        if not moves:
+            return LOSS, []
+        preferred = [m for m in (tt_move, self._pv[ply] if ply < len(self._pv) else None) if m in moves]
+        moves = list(dict.fromkeys(preferred + moves))
+        best = float("-inf")
+        best_line = []
+        original_alpha = alpha
+        for move in moves:
+            value, line = self._min_value(0, [move], depth, ply, alpha, beta)
+            if value > best:
+                best = value
+                best_line = [move] + line
+            if best > alpha:
+                alpha = best
+            if alpha >= beta:
+                break
+        flag = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+        if not limited:
+            self._store(key, (depth, best, flag, best_line[0], best_line))
+        return best, best_line
+
+    def _min_value(self, i: int, pending: list, depth: int, ply: int,
+                   alpha: float, beta: float) -> tuple[float, list[int]]:
+        # pending holds our move and the moves chosen so far for opponents[:i]
+        if i == len(self._opponents):
+            return self._play_round(pending, depth, ply, alpha, beta)
+        head = self._heads.get(self._opponents[i])
+        if head is None:
+            return self._min_value(i + 1, pending + [None], depth, ply, alpha, beta)
+        cells = self._board.cells
+        moves = [n for n in self._board.adjacency[head] if not cells[n]]
+        if not moves:
+            moves = [None]  # boxed in, dies this round
+        elif pending[0] in moves:
+            # meeting our head is the most dangerous reply, try it first
+            moves.remove(pending[0])
+            moves.insert(0, pending[0])
+        best = float("inf")
+        best_line = []
+        for move in moves:
+            value, line = self._min_value(i + 1, pending + [move], depth, ply, alpha, beta)
+            if value < best:
+                best = value
+                best_line = line
+            if best < beta:
+                beta = best
+            if alpha >= beta:
+                break
+        return best, best_line
+
+    def _play_round(self, pending: list, depth: int, ply: int, alpha: float, beta: float) -> tuple[float, list[int]]:
+        movers = [self._own_pid, *self._opponents]
+        targets = {}
+        for pid, target in zip(movers, pending):
+            if target is not None or pid in self._heads:
+                targets[pid] = target
+        claimed = {}
+        for target in targets.values():
+            claimed[target] = claimed.get(target, 0) + 1
+        if claimed[pending[0]] > 1:
+            return LOSS, []
+        cells = self._board.cells
+        undo = []
+        try:
+            for pid, target in targets.items():
+                old = self._heads.pop(pid)
+                self._head_set.discard(old)
+                self._head_key ^= self._own_keys[old] if pid == self._own_pid else self._opp_keys[old]
+                if target is None or claimed[target] > 1:
+                    undo.append((pid, old, None))
+                    continue
+                cells[target] = pid + 1
+                self.key ^= self._cell_keys[target]
+                self._heads[pid] = target
+                self._head_set.add(target)
+                self._head_key ^= self._own_keys[target] if pid == self._own_pid else self._opp_keys[target]
+                undo.append((pid, old, target))
+            return self._max_value(depth - 1, ply + 1, alpha, beta)
+        finally:
+            for pid, old, target in reversed(undo):
+                if target is not None:
+                    cells[target] = FREE
+                    self.key ^= self._cell_keys[target]
+                    del self._heads[pid]
+                    self._head_set.discard(target)
+                    self._head_key ^= self._own_keys[target] if pid == self._own_pid else self._opp_keys[target]
+                self._heads[pid] = old
+                self._head_set.add(old)
+                self._head_key ^= self._own_keys[old] if pid == self._own_pid else self._opp_keys[old]
+
+    def _evaluate(self) -> float:
+        started = time.perf_counter()
+        value = self._score()
+        elapsed = time.perf_counter() - started
+        self._slowest_leaf = max(self._slowest_leaf, elapsed)
+        self._leaf_cost = max(self._leaf_cost, elapsed)
+        return value
+
+    def _score(self) -> float:
+        board = self._board
+        own = self._heads[self._own_pid]
+        starts = [(n, n) for n in board.adjacency[own] if board.is_free(n)]
+        counts = self._flood_fill.count_many(board, starts, self._head_set, LEAF_FILL_LIMIT)
+        return max((amount / (1 + players) for amount, players in counts.values()), default=0.0)
@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Optional
+
+from util import Direction
+
+###
+# Local stand-in for the GPN Tron server.
+# Speaks the same line protocol ConnectionContext understands (motd, game, pos, tick, die,
+# lose, message, error), hosts simulated opponents and records how long each real client
+# takes between a tick and its move.
+
+
+class SimPlayer:
+    def __init__(self, pid: int, name: str):
+        self.pid = pid
+        self.name = name
+        self.pos = None
+        self.direction = Direction.UP
+        self.alive = True
+
+    def choose(self, match: "Match") -> Direction:
+        return self.direction
+
+
+class StraightPlayer(SimPlayer):
+    # keeps its direction until blocked, then turns to any free side
+    def choose(self, match: "Match") -> Direction:
+        for direc in [self.direction, self.direction.rotate_ccw(), self.direction.rotate_cw()]:
+            if match.is_free(*match.step(self.pos, direc)):
+                return direc
+        return self.direction
+
+
+class RandomPlayer(SimPlayer):
+    def choose(self, match: "Match") -> Direction:
+        free = [d for d in Direction if match.is_free(*match.step(self.pos, d))]
+        if not free:
+            return self.direction
+        if self.direction in free and random.random() < 0.7:
+            return self.direction
+        return random.choice(free)
+
+
+class GreedyPlayer(SimPlayer):
+    # moves to the free neighbour with the most free neighbours of its own
+    def choose(self, match: "Match") -> Direction:
+        best = self.direction
+        best_free = -1
+        for direc in Direction:
+            cell = match.step(self.pos, direc)
+            if not match.is_free(*cell):
+                continue
+            free = sum(match.is_free(*match.step(cell, d)) for d in Direction)
+            if free > best_free:
+                best = direc
+                best_free = free
+        return best
+
+
+STRATEGIES = {"straight": StraightPlayer, "random": RandomPlayer, "greedy": GreedyPlayer}
+
+
+class ClientPlayer(SimPlayer):
+    def __init__(self, pid: int, name: str, writer: asyncio.StreamWriter):
+        SimPlayer.__init__(self, pid, name)
+        self.writer = writer
+        self.connected = True
+        self.pending: Optional[Direction] = None
+        self.move_event = asyncio.Event()
+        self.tick_sent = 0.0
+        self.latencies = []
+        self.timeouts = 0
+
+    def choose(self, match: "Match") -> Direction:
+        if self.pending is None:
+            self.timeouts += 1
+            return self.direction
+        return self.pending
+
+    def send(self, *lines: str):
+        if self.connected:
+            self.writer.write("".join(line + "\n" for line in lines).encode('utf8'))
+
+
+class Match:
+    def __init__(self, width: int, height: int, players: list[SimPlayer]):
+        self.width = width
+        self.height = height
+        self.players = players
+        self.grid = [[None] * height for _ in range(width)]
+        self.tick = 0
+        for player in players:
+            while True:
+                x = random.randrange(width)
+                y = random.randrange(height)
+                if self.grid[x][y] is None:
+                    break
+            player.pos = (x, y)
+            player.direction = random.choice(list(Direction))
+            self.grid[x][y] = player.pid
+
+    def step(self, pos: tuple[int, int], direc: Direction) -> tuple[int, int]:
+        return direc.get_x(pos[0], self.width), direc.get_y(pos[1], self.height)
+
+    def is_free(self, x: int, y: int) -> bool:
+        return self.grid[x][y] is None
+
+    def alive(self) -> list[SimPlayer]:
+        return [p for p in self.players if p.alive]
+
+    def advance(self) -> list[SimPlayer]:
+        # moves every living player at once and returns the ones that died
+        alive = self.alive()
+        targets = {}
+        for player in alive:
+            player.direction = player.choose(self)
+            targets[player.pid] = self.step(player.pos, player.direction)
+        claimed = {}
+        for target in targets.values():
+            claimed[target] = claimed.get(target, 0) + 1
+        dead = []
+        for player in alive:
+            target = targets[player.pid]
+            if not self.is_free(*target) or claimed[target] > 1:
+                dead.append(player)
+        for player in alive:
+            if player not in dead:
+                player.pos = targets[player.pid]
+                self.grid[player.pos[0]][player.pos[1]] = player.pid
+        for player in dead:
+            player.alive = False
+            for col in self.grid:
+                for y, pid in enumerate(col):
+                    if pid == player.pid:
+                        col[y] = None
+        self.tick += 1
+        return dead
+
+
+class SimServer:
+    def __init__(self, args):
+        self._args = args
+        self._waiting: list[ClientPlayer] = []
+        self._clients_ready = asyncio.Event()
+        self._next_pid = 0
+        self._report = {}
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = None
+        writer.write(b"motd|local gpn tron stand-in\n")
+        while True:
+            try:
+                line = await reader.readline()
+            except ConnectionError:
+                break
+            if not line:
+                break
+            args = line.decode('utf8').rstrip("\n").split("|")
+            code = args[0]
+            if code == "join" and client is None and len(args) >= 2:
+                client = ClientPlayer(self._new_pid(), args[1], writer)
+                self._waiting.append(client)
+                print("%s joined as player %i" % (client.name, client.pid))
+                if len(self._waiting) >= self._args.clients:
+                    self._clients_ready.set()
+            elif code == "move" and client is not None and len(args) >= 2:
+                try:
+                    direc = Direction(args[1])
+                except ValueError:
+                    writer.write(b"error|unknown direction\n")
+                    continue
+                if client.pending is None and client.alive:
+                    client.latencies.append(time.perf_counter() - client.tick_sent)
+                client.pending = direc
+                client.move_event.set()
+            elif code == "chat" and client is not None and len(args) >= 2:
+                for other in self._waiting:
+                    other.send("message|%i|%s" % (client.pid, args[1]))
+            elif code != "join":
+                writer.write(b"error|unexpected command\n")
+        if client is not None:
+            client.connected = False
+
+    def _new_pid(self) -> int:
+        pid = self._next_pid
+        self._next_pid += 1
+        return pid
+
+    async def run(self):
+        args = self._args
+        server = await asyncio.start_server(self.handle_client, args.host, args.port)
+        print("Listening on %s:%i, waiting for %i client(s)" % (args.host, args.port, args.clients))
+        async with server:
+            await self._clients_ready.wait()
+            for number in range(args.matches):
+                await self.run_match(number)
+            for client in self._waiting:
+                client.connected = False
+                client.writer.close()
+            await asyncio.sleep(0.1)
+        self.print_report()
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(self._report, f, indent=2)
+
+    async def run_match(self, number: int):
+        args = self._args
+        clients = [c for c in self._waiting if c.connected]
+        opponents = [STRATEGIES[args.strategy](len(clients) + i, "sim%i" % i) for i in range(args.opponents)]
+        players = clients + opponents
+        for pid, player in enumerate(players):
+            player.pid = pid
+            player.alive = True
+        match = Match(args.width, args.height, players)
+        interval = 1 / args.tick_rate
+        for client in clients:
+            client.send("game|%i|%i|%i" % (args.width, args.height, client.pid))
+        print("Match %i: %ix%i, %i client(s), %i opponent(s)" % (number, args.width, args.height, len(clients), len(opponents)))
+        dead = []
+        while match.tick < args.max_ticks:
+            lines = ["pos|%i|%i|%i" % (p.pid, p.pos[0], p.pos[1]) for p in match.alive()]
+            if dead:
+                lines.append("die|" + "|".join(str(p.pid) for p in dead))
+            lines.append("tick")
+            now = time.perf_counter()
+            for client in clients:
+                client.pending = None
+                client.move_event.clear()
+                client.tick_sent = now
+                if client.alive:
+                    client.send(*lines)
+            await self._wait_for_moves([c for c in clients if c.alive and c.connected], now + interval)
+            dead = match.advance()
+            for player in dead:
+                if isinstance(player, ClientPlayer):
+                    player.send("lose")
+            living_clients = [c for c in clients if c.alive and c.connected]
+            if not living_clients or len(match.alive()) <= 1:
+                break
+        for client in clients:
+            stats = self._report.setdefault(client.name, {"ticks": 0, "timeouts": 0, "latencies_ms": []})
+            stats["timeouts"] += client.timeouts
+            stats["latencies_ms"].extend(round(l * 1000, 3) for l in client.latencies)
+            stats["ticks"] = len(stats["latencies_ms"]) + stats["timeouts"]
+            client.latencies = []
+            client.timeouts = 0
+        print("Match %i over after %i ticks, alive: %s" % (number, match.tick, [p.name for p in match.alive()]))
+
+    async def _wait_for_moves(self, clients: list[ClientPlayer], deadline: float):
+        if clients:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(c.move_event.wait() for c in clients)),
+                                       max(0.0, deadline - time.perf_counter()))
+            except asyncio.TimeoutError:
+                pass
+        # keep the tick rate even when everybody answered early
+        await asyncio.sleep(max(0.0, deadline - time.perf_counter()))
+
+    def print_report(self):
+        for name, stats in self._report.items():
+            latencies = sorted(stats["latencies_ms"])
+            if latencies:
+                p50 = statistics.median(latencies)
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                print("%s: %i ticks, %i timeouts, p50 %.2fms, p99 %.2fms, max %.2fms"
+                      % (name, stats["ticks"], stats["timeouts"], p50, p99, latencies[-1]))
+            else:
+                print("%s: %i ticks, %i timeouts, no moves received" % (name, stats["ticks"], stats["timeouts"]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local GPN Tron stand-in server for load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=4000)
+    parser.add_argument('--width', type=int, default=64)
+    parser.add_argument('--height', type=int, default=64)
+    parser.add_argument('-o', '--opponents', type=int, default=8)
+    parser.add_argument('--strategy', choices=list(STRATEGIES), default='random')
+    parser.add_argument('-r', '--tick-rate', type=float, default=5, help='ticks per second')
+    parser.add_argument('-c', '--clients', type=int, default=1, help='real clients to wait for')
+    parser.add_argument('-m', '--matches', type=int, default=1)
+    parser.add_argument('--max-ticks', type=int, default=10000)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--report', help='write per-client latencies as JSON to this file')
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    try:
+        asyncio.run(SimServer(args).run())
+    except KeyboardInterrupt:
+        sys.exit(1)
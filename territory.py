@@ -0,0 +1,95 @@
+from typing import Hashable, Iterable, Optional
+
+from board import Board
+from util import Deadline
+
+try:
+    import numpy as np
+except ImportError:  # territory scoring is optional
+    np = None
+
+UNREACHED = 2 ** 31 - 1
+
+
+class TerritoryEvaluator:
+    ###
+    # Voronoi-style territory on the wrapping board.
+    # Distance maps are grown with a breadth-first search that expands the whole frontier at once
+    # (np.roll along both axes wraps around the torus), so a search costs one set of array
+    # operations per distance step instead of one Python step per cell.
+    # With a deadline, searches check it after every distance step and give up (None) once it passed.
+    # The board's cell array is viewed in place as a (width, height) array indexed [x, y].
+    def __init__(self, board: Board):
+        self._width = board.width
+        self._height = board.height
+        self._cells = np.frombuffer(board.cells, dtype=np.uint16).reshape(board.width, board.height)
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None
+
+    def distance_maps(self, sources: list[tuple[int, int]]) -> "np.ndarray":
+        # one distance map per source, shape (len(sources), width, height)
+        seeds = np.zeros((len(sources), self._width, self._height), dtype=bool)
+        for i, (x, y) in enumerate(sources):
+            seeds[i, x, y] = True
+        return self._bfs(seeds, self._cells == 0)
+
+    def nearest_distance(self, sources: list[tuple[int, int]], free: Optional["np.ndarray"] = None,
+                         deadline: Optional[Deadline] = None) -> Optional["np.ndarray"]:
+        # element-wise minimum of distance_maps(sources), computed with a single multi-source search
+        seeds = np.zeros((self._width, self._height), dtype=bool)
+        for x, y in sources:
+            seeds[x, y] = True
+        return self._bfs(seeds, self._cells == 0 if free is None else free, deadline=deadline)
+
+    def cells_won(self, own_playerid: int, player_positions: dict[int, list[int]],
+                  starts: Iterable[tuple[Hashable, int]],
+                  deadline: Optional[Deadline] = None) -> Optional[dict[Hashable, int]]:
+        # Number of cells we reach strictly before every opponent when we move to each start.
+        # Moves are simultaneous: we stand on a start after one tick, an opponent is one
+        # step away from its head after one tick. Cells an opponent reaches first (or at
+        # the same time) are theirs and stop our search.
+        starts = list(starts)
+        free = self._cells == 0
+        opponents = [(pos[0], pos[1]) for pid, pos in player_positions.items() if pid != own_playerid]
+        if opponents:
+            opponent_dist = self.nearest_distance(opponents, free, deadline)
+            if opponent_dist is None:
+                return None
+        else:
+            opponent_dist = np.full((self._width, self._height), UNREACHED, dtype=np.int32)
+        seeds = np.zeros((len(starts), self._width, self._height), dtype=bool)
+        for i, (_, idx) in enumerate(starts):
+            x, y = divmod(idx, self._height)
+            seeds[i, x, y] = free[x, y]
+        own_dist = self._bfs(seeds, free, first_step=1, opponent_dist=opponent_dist, deadline=deadline)
+        if own_dist is None:
+            return None
+        won = ((own_dist < opponent_dist) & (own_dist != UNREACHED)).sum(axis=(1, 2))
+        return {key: int(won[i]) for i, (key, _) in enumerate(starts)}
+
+    def _bfs(self, seeds: "np.ndarray", free: "np.ndarray", first_step: int = 0,
+             opponent_dist: Optional["np.ndarray"] = None,
+             deadline: Optional[Deadline] = None) -> Optional["np.ndarray"]:
+        dist = np.full(seeds.shape, UNREACHED, dtype=np.int32)
+        dist[seeds] = first_step
+        visited = seeds.copy()
+        frontier = seeds
+        step = first_step
+        while frontier.any():
+            if deadline is not None and deadline.expired():
+                return None
+            step += 1
+            grown = np.roll(frontier, 1, axis=-2)
+            grown |= np.roll(frontier, -1, axis=-2)
+            grown |= np.roll(frontier, 1, axis=-1)
+            grown |= np.roll(frontier, -1, axis=-1)
+            grown &= free
+            grown &= ~visited
+            if opponent_dist is not None:
+                grown &= opponent_dist > step
+            np.putmask(dist, grown, step)
+            visited |= grown
+            frontier = grown
+        return dist
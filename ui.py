@@ -1,15 +1,18 @@
-from multiprocessing import Queue
+import queue
+import time
+from multiprocessing import Process, Queue
 from tkinter import *
-from typing import Union
+from typing import NamedTuple, Optional
 
+from renderer import Renderer
 from util import Direction
 
 COLORS = ["#e6b0aa", "#c39bd3", "#7fb3d5", "#48c9b0", "#52be80", "#f4d03f", "#f5b041", "#dc7633", "green", "yellow", "blue", "magenta", "cyan"]
 
 class GUI(Tk):
-    def __init__(self, x: int, y: int):
+    def __init__(self, x: int, y: int, max_window: int = 1000):
         Tk.__init__(self)
-        self._grid_size = 20
+        self._grid_size = max(2, min(20, max_window // max(x, y)))
         self._size = (x,y)
         width = x * self._grid_size
         height = y * self._grid_size
@@ -18,54 +21,78 @@ class GUI(Tk):
 
         self.canvas = Canvas(self, bg='white', width=width, height=height)
         self.canvas.pack()
-        self.queue = Queue()
-
-    def update_game(self, player_heads: dict[int, tuple[int, int]], grid: list[int,list[int, Union[int, None]]],
-                    own_pid: int, could_collide: set[Direction], move_dir: Direction,
-                    move_reasons: list[int,list[int, Union[int, None]]]):
-        self.canvas.delete('all')
+        self._cells = {}  # (x, y) -> (canvas item, pid)
+        self._player_cells = {}
+        self._reasons = {}
         self._draw_grid(*self._size)
 
-        print(len(could_collide))
-
-        grid_size = len(grid)
-        x = 0
-        for xvals in grid:
-            y = 0
-            for pid in xvals:
-                if pid is not None:
-                    self.canvas.create_rectangle(x, y, x+self._grid_size, y+self._grid_size, fill=COLORS[pid % len(COLORS)])
-                y += self._grid_size
-            x += self._grid_size
-
-        x = 0
-        for xvals in move_reasons:
-            y = 0
-            for reason in xvals:
-                if reason is not None:
-                    self.canvas.create_text(x + self._grid_size/2, y + self._grid_size/1.5, text=reason, fill="black", font=(f'Helvetica {int(self._grid_size/1.5)} bold'))
-                y += self._grid_size
-            x += self._grid_size
+    def apply_frame(self, frame: "Frame", draw_heads: bool = True):
+        # only touches canvas items for what changed, call update() to get it on screen
+        for pid in frame.removed:
+            self.remove_player(pid)
+        for x, y, pid in frame.cells:
+            self.set_cell(x, y, pid)
+        for x, y, reason in frame.reasons:
+            self.set_reason(x, y, reason)
+        if frame.title is not None:
+            self.wm_title(frame.title)
+        if draw_heads:
+            self.draw_heads(frame.heads, frame.own_pid, {Direction(d) for d in frame.could_collide},
+                            Direction(frame.move_dir))
+
+    def set_cell(self, x: int, y: int, pid: int):
+        old = self._cells.pop((x, y), None)
+        if old is not None:
+            item, old_pid = old
+            self.canvas.delete(item)
+            # the cell is no longer the old owner's, removing that player must not touch it
+            self._player_cells.get(old_pid, set()).discard((x, y))
+        px = x * self._grid_size
+        py = y * self._grid_size
+        item = self.canvas.create_rectangle(px, py, px + self._grid_size, py + self._grid_size,
+                                            fill=COLORS[pid % len(COLORS)], tags=("cell", f"p{pid}"))
+        self._cells[(x, y)] = (item, pid)
+        self._player_cells.setdefault(pid, set()).add((x, y))
+
+    def remove_player(self, pid: int):
+        self.canvas.delete(f"p{pid}")
+        for cell in self._player_cells.pop(pid, ()):
+            self._cells.pop(cell, None)
+
+    def set_reason(self, x: int, y: int, reason: str):
+        old = self._reasons.pop((x, y), None)
+        if old is not None:
+            self.canvas.delete(old)
+        self._reasons[(x, y)] = self.canvas.create_text(
+            x * self._grid_size + self._grid_size/2, y * self._grid_size + self._grid_size/1.5, text=reason,
+            fill="black", font=(f'Helvetica {int(self._grid_size/1.5)} bold'), tags="reason")
 
+    def draw_heads(self, player_heads: dict[int, list[int]], own_pid: int, could_collide: set[Direction],
+                   move_dir: Direction):
+        width, height = self._size
+        self.canvas.delete("head")
         for (pid, pos) in player_heads.items():
             x = pos[0]
             y = pos[1]
             if pid == own_pid:
                 self.draw_x(x, y, "red")
-                self.draw_x(move_dir.get_x(x, grid_size), move_dir.get_y(y, grid_size), "red")
+                self.draw_x(move_dir.get_x(x, width), move_dir.get_y(y, height), "red")
                 for direc in could_collide:
-                    self.draw_x(direc.get_x(pos[0], grid_size), direc.get_y(pos[1], grid_size), "gray")
+                    self.draw_x(direc.get_x(pos[0], width), direc.get_y(pos[1], height), "gray")
             else:
                 self.draw_x(x, y, "white")
-        self.update()
+        self.canvas.tag_raise("reason")
+        self.canvas.tag_raise("head")
 
     def draw_x(self, x, y, color):
         x = x * self._grid_size
         y = y * self._grid_size
-        self.canvas.create_line(x, y, x + self._grid_size, y + self._grid_size, fill=color, width=2)
-        self.canvas.create_line(x, y + self._grid_size, x + self._grid_size, y, fill=color, width=2)
+        self.canvas.create_line(x, y, x + self._grid_size, y + self._grid_size, fill=color, width=2, tags="head")
+        self.canvas.create_line(x, y + self._grid_size, x + self._grid_size, y, fill=color, width=2, tags="head")
 
     def _draw_grid(self, x, y):
+        if self._grid_size < 5:
+            return  # lines would cover the cells
         for i in range(1, x):
             pos = i * self._grid_size
             self.canvas.create_line(pos, 0, pos, y * self._grid_size, width=1, fill="lightgray")
@@ -73,3 +100,87 @@ class GUI(Tk):
             pos = i * self._grid_size
             self.canvas.create_line(0, pos, x * self._grid_size, pos, width=1, fill="lightgray")
 
+
+class Frame(NamedTuple):
+    title: Optional[str]
+    cells: list[tuple[int, int, int]]
+    removed: list[int]
+    heads: dict[int, list[int]]
+    own_pid: int
+    could_collide: list[str]
+    move_dir: str
+    reasons: list[tuple[int, int, str]]
+
+
+class GUIProcess(Renderer):
+    ###
+    # Runs the GUI in its own process so drawing never delays a move.
+    # Only what changed since the last frame is sent over a small queue. When the renderer
+    # falls behind and the queue is full, the frame is not sent and its changes are merged
+    # into the next one instead.
+    def __init__(self, width: int, height: int, max_queued: int = 2, max_fps: float = 30):
+        self._queue = Queue(maxsize=max_queued)
+        self._process = Process(target=_run_gui, args=(width, height, self._queue, max_fps), daemon=True)
+        self._process.start()
+        self._title = None
+        self._cells = []
+        self._removed = []
+        self._reasons = []
+
+    def wm_title(self, title: str):
+        self._title = title
+
+    def add_cell(self, x: int, y: int, pid: int):
+        self._cells.append((x, y, pid))
+
+    def remove_player(self, pid: int):
+        self._removed.append(pid)
+        # cells of a removed player that were never sent don't need to be drawn
+        self._cells = [cell for cell in self._cells if cell[2] != pid]
+
+    def update_game(self, player_heads: dict[int, list[int]], own_pid: int, could_collide: set[Direction],
+                    move_dir: Direction, reason: Optional[tuple[int, int, str]]):
+        if reason is not None:
+            self._reasons.append(reason)
+        frame = Frame(self._title, self._cells, self._removed, dict(player_heads), own_pid,
+                      [d.value for d in could_collide], move_dir.value, self._reasons)
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            return
+        self._cells = []
+        self._removed = []
+        self._reasons = []
+
+    def close(self):
+        if self._process.is_alive():
+            self._process.terminate()
+
+
+def _run_gui(width: int, height: int, frames: Queue, max_fps: float):
+    gui = GUI(width, height)
+    min_interval = 1 / max_fps
+    last_draw = 0
+    latest = None
+    while True:
+        try:
+            frame = frames.get(timeout=min_interval)
+        except queue.Empty:
+            frame = None
+        # apply everything that piled up, heads only need to be drawn for the newest frame
+        while frame is not None:
+            gui.apply_frame(frame, draw_heads=False)
+            latest = frame
+            try:
+                frame = frames.get_nowait()
+            except queue.Empty:
+                frame = None
+        now = time.monotonic()
+        if now - last_draw < min_interval:
+            continue
+        if latest is not None:
+            gui.draw_heads(latest.heads, latest.own_pid, {Direction(d) for d in latest.could_collide},
+                           Direction(latest.move_dir))
+            latest = None
+        gui.update()
+        last_draw = now
@@ -1,4 +1,8 @@
+import time
 from enum import Enum
+from typing import Optional
+
+SEND_MARGIN = 0.002  # seconds of the tick budget kept back for rendering and sending the move
 
 
 class MoveReason(Enum):
@@ -7,6 +11,9 @@ class MoveReason(Enum):
     BOXED = "B"
     CONTINUE = "C"
     FLOOD_FILL = "F"
+    FALLBACK = "T"
+    TERRITORY = "V"
+    LOOKAHEAD = "L"
 
 
 class Position:
@@ -63,26 +70,60 @@ class Direction(Enum):
         return new_pos
 
     def get_x(self, x: int, width: int):
-        if self == Direction.UP or self == Direction.DOWN:
-            return x
-        if self == Direction.LEFT:
-            return (x - 1) % width
-        return (x + 1) % width
+        return (x + _DELTAS[self][0]) % width
 
     def get_y(self, y: int, height: int):
-        if self == Direction.LEFT or self == Direction.RIGHT:
-            return y
-        if self == Direction.UP:
-            return (y - 1) % height
-        return (y + 1) % height
+        return (y + _DELTAS[self][1]) % height
+
+
+_DELTAS = {
+    Direction.UP: (0, -1),
+    Direction.DOWN: (0, 1),
+    Direction.LEFT: (-1, 0),
+    Direction.RIGHT: (1, 0),
+}
 
 
 class Path:
     def __init__(self, *directions: Direction):
         self.directions = list(directions)
+        self._offset = None
+
+    def offset(self) -> tuple[int, int]:
+        # summed (dx, dy) of all steps, computed once per path
+        if self._offset is None:
+            self._offset = (sum(_DELTAS[d][0] for d in self.directions), sum(_DELTAS[d][1] for d in self.directions))
+        return self._offset
 
     def resolve(self, arg_pos: Position) -> Position:
-        pos = arg_pos.clone()
-        for direction in self.directions:
-            pos = direction.from_position_absolute(pos)
-        return pos
+        dx, dy = self.offset()
+        return Position((arg_pos.x + dx) % arg_pos.field_width, (arg_pos.y + dy) % arg_pos.field_height,
+                        arg_pos.field_width, arg_pos.field_height)
+
+
+class Deadline:
+    def __init__(self, start: float, budget: Optional[float], margin: float = SEND_MARGIN):
+        # start is a time.perf_counter() value, budget is in seconds (None means unbounded).
+        # at is when the move has to be sent, stop_at is when deciding has to end so that
+        # rendering and sending still fit in; the margin is capped at a quarter of the budget
+        self.start = start
+        self.at = None if budget is None else start + budget
+        self.stop_at = None if budget is None else self.at - min(margin, budget / 4)
+
+    def expired(self) -> bool:
+        return self.stop_at is not None and time.perf_counter() >= self.stop_at
+
+    def remaining(self) -> Optional[float]:
+        # until the move has to be sent
+        if self.at is None:
+            return None
+        return self.at - time.perf_counter()
+
+    def work_left(self) -> Optional[float]:
+        # until deciding has to end
+        if self.stop_at is None:
+            return None
+        return self.stop_at - time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start